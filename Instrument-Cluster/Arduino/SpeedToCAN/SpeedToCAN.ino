@@ -17,6 +17,7 @@ volatile unsigned long lastEdgeUs = 0;
 const unsigned long minPeriodUs = 300;        // ignore edges faster than this
 
 unsigned long lastCalcMs = 0;
+unsigned long lastCalcUs = 0;
 unsigned long lastDebugMs = 0;
 
 void countPulses() {
@@ -68,16 +69,34 @@ void sendSpeedCms10(float cms) {
   CAN0.sendMsgBuf(0x100, 0, 2, data);
 }
 
+// Raw encoder interval: pulse count + exact window so the Pi can compute
+// speed (and its quantisation noise) without the whole-cm/s rounding.
+void sendEncoderInterval(unsigned long pulses, unsigned long windowUs) {
+  if (pulses > 0xFFFF) pulses = 0xFFFF;
+  byte data[6] = {
+    (byte)(pulses >> 8), (byte)(pulses & 0xFF),
+    (byte)(windowUs >> 24), (byte)(windowUs >> 16),
+    (byte)(windowUs >> 8), (byte)(windowUs & 0xFF)
+  }; // big-endian
+
+  CAN0.sendMsgBuf(0x101, 0, 6, data);
+}
+
 void loop() {
   unsigned long nowMs = millis();
 
   if (nowMs - lastCalcMs >= 50) { // 20 Hz
     unsigned long pulses;
+    unsigned long nowUs;
     noInterrupts();
     pulses = pulseCount;
     pulseCount = 0;
+    nowUs = micros();
     interrupts();
 
+    unsigned long windowUs = nowUs - lastCalcUs;
+    lastCalcUs = nowUs;
+
     float dt = (nowMs - lastCalcMs) / 1000.0f;
     lastCalcMs = nowMs;
 
@@ -96,8 +115,9 @@ void loop() {
       inst_cms = 0.0f;
     }
 
-    // Send the speed via CAN
+    // Send the speed via CAN (0x100 kept for older receivers)
     sendSpeedCms10(inst_cms);
+    sendEncoderInterval(pulses, windowUs);
 
     // Debug output for encoder data
     if ((nowMs - lastDebugMs >= 200) && (pulses > 0 || inst_cms > 5.0)) {
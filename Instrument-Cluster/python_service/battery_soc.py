@@ -0,0 +1,721 @@
+#!/usr/bin/env python3
+"""
+Battery state of charge for the PiRacer 3S 18650 pack (INA219):
+- RollingStats: O(1) sliding-window mean/variance/slope/min/max
+- SocCurve: precompiled voltage->SOC lookup (bisect / np.interp), per-pack curve files
+- StableBatterySOC: lookup-table SOC with load compensation, trend and stability
+- CoulombSocEstimator: 1-D EKF, integrates current and corrects with the OCV curve
+- Ina219Reader: on-chip ADC averaging + one-pass V/I/P register reads
+- BatterySampler: background thread that keeps a ring buffer of INA219
+  readings and a cached estimate, so callers never wait on I2C or sleeps;
+  the read interval adapts to load current and how fast SOC is moving
+"""
+
+import os
+import sys
+import math
+import time
+import bisect
+import threading
+import statistics
+from array import array
+from collections import deque
+from periodic import Periodic
+
+# ==================== Tunables ====================
+MIN_PERIOD = 0.15       # s between read passes under load (>= one 128x conversion cycle)
+MAX_PERIOD = 5.0        # s between read passes when parked
+IDLE_CURRENT_MA = 300.0 # at or below: idle
+HIGH_CURRENT_MA = 2000.0  # at or above: full load -> MIN_PERIOD
+STEP_CURRENT_MA = 500.0 # current jump between passes that counts as a transient
+FAST_SOC_RATE = 0.05    # %/s of SOC change that counts as fast
+SOC_RATE_TAU = 5.0      # s smoothing of the SOC rate (single EKF corrections are noisy)
+BACKOFF = 1.5           # max growth of the interval per pass
+ADC_AVERAGING = 128     # on-chip samples per conversion (1..128; 128 -> 68 ms per ADC)
+CAL_REFRESH = 50        # passes between calibration rewrites (INA219 may reset under load)
+REG_BUSVOLTAGE = 0x02   # INA219 bus voltage register
+VOLTAGE_WINDOW = 5      # readings per trimmed-mean voltage
+CURRENT_WINDOW = 3      # readings per mean current
+PUBLISH_PERIOD = 1.0    # s between estimates handed to the service
+HISTORY_SAMPLES = 10    # estimates kept for trend/stability
+
+TREND_DELTA_V = 0.05    # fitted change over the window that counts as rising/falling
+
+# Coulomb-counting EKF
+CAPACITY_MAH = 2600.0   # 3S1P 18650 pack
+SOC_INIT_VAR = 25.0     # %² when seeded from a single voltage lookup
+SOC_PROCESS_VAR = 1e-3  # %²/s: current sensor offset/gain error
+OCV_VAR_REST = 0.02**2  # V² voltage noise at rest
+OCV_SIGMA_PER_A = 0.05  # V per A of load: error left after IR compensation
+MAX_DT_PERIODS = 2.0    # integrate gaps up to this many slowest read intervals;
+                        # longer gaps (stalled reads) only inflate the variance
+MAX_DT = MAX_DT_PERIODS * MAX_PERIOD
+UPDATE_BUDGET_US = 200.0
+
+# 3S 18650 Li-ion discharge curve (voltage, SOC %)
+DEFAULT_PACK = '3S 18650 Li-ion'
+DEFAULT_CURVE = [
+    (12.60, 100),  # 4.20V per cell - Full charge
+    (12.45, 95),   # 4.15V per cell
+    (12.30, 90),   # 4.10V per cell
+    (12.15, 85),   # 4.05V per cell
+    (12.00, 80),   # 4.00V per cell
+    (11.85, 75),   # 3.95V per cell
+    (11.70, 70),   # 3.90V per cell
+    (11.58, 65),   # 3.86V per cell
+    (11.46, 60),   # 3.82V per cell
+    (11.34, 55),   # 3.78V per cell
+    (11.22, 50),   # 3.74V per cell - Mid discharge
+    (11.10, 45),   # 3.70V per cell
+    (10.98, 40),   # 3.66V per cell
+    (10.86, 35),   # 3.62V per cell
+    (10.74, 30),   # 3.58V per cell
+    (10.62, 25),   # 3.54V per cell
+    (10.50, 20),   # 3.50V per cell
+    (10.35, 15),   # 3.45V per cell
+    (10.20, 10),   # 3.40V per cell
+    (10.05, 5),    # 3.35V per cell
+    (9.90,  2),    # 3.30V per cell
+    (9.75,  1),    # 3.25V per cell
+    (9.00,  0),    # 3.00V per cell - Cutoff
+]
+
+CURVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'battery_curves')
+
+# ==================== SOC lookup ====================
+class SocCurve:
+    """
+    Monotonic voltage->SOC curve compiled once: ascending breakpoints plus a
+    per-segment slope, so a scalar lookup is one bisect and one multiply.
+    Whole traces go through np.interp (numpy imported on first use).
+    Outside the table the SOC clamps to the end points.
+    """
+    def __init__(self, points, name=DEFAULT_PACK):
+        pts = sorted((float(v), float(p)) for v, p in points)
+        if len(pts) < 2:
+            raise ValueError("SOC curve needs at least two points")
+        for (v0, p0), (v1, p1) in zip(pts, pts[1:]):
+            if v1 <= v0 or p1 < p0:
+                raise ValueError(f"SOC curve not monotonic at {v0:.3f}V/{v1:.3f}V")
+        self.name = name
+        self.volts = [v for v, _ in pts]
+        self.socs = [p for _, p in pts]
+        self.slopes = [(p1 - p0) / (v1 - v0)
+                       for (v0, p0), (v1, p1) in zip(pts, pts[1:])]
+        self.v_min = self.volts[0]
+        self.v_max = self.volts[-1]
+
+    @classmethod
+    def load(cls, path):
+        """
+        Curve file: one "voltage, soc" pair per line (comma or whitespace),
+        '#' comments, optional "# name: <pack>" line.
+        """
+        name = os.path.splitext(os.path.basename(path))[0]
+        points = []
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith('#'):
+                    if line[1:].strip().lower().startswith('name:'):
+                        name = line[1:].strip()[5:].strip()
+                    continue
+                v, p = line.replace(',', ' ').split()[:2]
+                points.append((float(v), float(p)))
+        return cls(points, name=name)
+
+    def soc(self, voltage):
+        volts = self.volts
+        if voltage >= self.v_max:
+            return self.socs[-1]
+        if voltage <= self.v_min:
+            return self.socs[0]
+        i = bisect.bisect_right(volts, voltage) - 1
+        return self.socs[i] + (voltage - volts[i]) * self.slopes[i]
+
+    def voltage(self, soc):
+        """Inverse lookup: OCV for a given SOC, and dV/dSOC at that point."""
+        socs = self.socs
+        if soc >= socs[-1]:
+            i = len(socs) - 2
+        elif soc <= socs[0]:
+            i = 0
+        else:
+            i = min(bisect.bisect_right(socs, soc) - 1, len(socs) - 2)
+        slope = self.slopes[i]
+        if slope <= 0.0:
+            return self.volts[i], 0.0
+        dv = 1.0 / slope
+        return self.volts[i] + (soc - socs[i]) * dv, dv
+
+    def soc_array(self, voltages):
+        """SOC for a whole voltage trace in one vectorised call."""
+        import numpy as np
+        return np.interp(np.asarray(voltages, dtype=float), self.volts, self.socs)
+
+def load_curve(name_or_path=None):
+    """None -> built-in pack; otherwise a file path or a name in battery_curves/."""
+    if not name_or_path:
+        return SocCurve(DEFAULT_CURVE)
+    path = name_or_path
+    if not os.path.exists(path):
+        path = os.path.join(CURVE_DIR, name_or_path)
+        if not path.endswith('.csv'):
+            path += '.csv'
+    return SocCurve.load(path)
+
+# ==================== Rolling statistics ====================
+class RollingStats:
+    """
+    Fixed-capacity sliding window over an array('d') ring. Each push is
+    O(1) (min/max amortised) regardless of capacity:
+    - mean/variance: Welford update with removal of the evicted sample
+    - slope: least squares against sample index, from running Σy and Σjy
+    - min/max: monotonic deques
+    Running sums are rebuilt from the ring every few windows so float
+    error cannot accumulate over long drives.
+    """
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self._buf = array('d', bytes(8 * self.capacity))
+        self._head = 0          # next write slot (oldest sample once full)
+        self._n = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._sy = 0.0          # Σ y
+        self._sjy = 0.0         # Σ j·y, j = 0 for the oldest sample
+        self._seq = 0           # samples pushed so far
+        self._minq = deque()    # (seq, value), values increasing
+        self._maxq = deque()    # (seq, value), values decreasing
+
+    def __len__(self):
+        return self._n
+
+    def push(self, y):
+        cap = self.capacity
+        if self._n == cap:
+            self._evict(self._buf[self._head])
+        self._buf[self._head] = y
+        self._head = (self._head + 1) % cap
+
+        n = self._n
+        self._sjy += n * y
+        self._sy += y
+        self._n = n + 1
+        delta = y - self._mean
+        self._mean += delta / self._n
+        self._m2 += delta * (y - self._mean)
+
+        seq = self._seq
+        minq, maxq = self._minq, self._maxq
+        while minq and minq[-1][1] >= y:
+            minq.pop()
+        minq.append((seq, y))
+        while maxq and maxq[-1][1] <= y:
+            maxq.pop()
+        maxq.append((seq, y))
+        expired = seq - cap
+        if minq[0][0] <= expired:
+            minq.popleft()
+        if maxq[0][0] <= expired:
+            maxq.popleft()
+        self._seq = seq + 1
+        if self._seq % (4 * cap) == 0:
+            self._resync()
+
+    def _evict(self, x):
+        n = self._n - 1
+        self._sy -= x
+        self._sjy -= self._sy       # every remaining index shifts down by one
+        if n == 0:
+            self._mean = self._m2 = 0.0
+        else:
+            delta = x - self._mean
+            self._mean -= delta / n
+            self._m2 -= delta * (x - self._mean)
+        self._n = n
+
+    def _resync(self):
+        vals = self.values()
+        n = len(vals)
+        self._sy = math.fsum(vals)
+        self._sjy = math.fsum(j * y for j, y in enumerate(vals))
+        self._mean = self._sy / n if n else 0.0
+        self._m2 = math.fsum((y - self._mean) ** 2 for y in vals)
+
+    def values(self):
+        """Samples oldest first (O(n), for snapshots and debugging)."""
+        if self._n < self.capacity:
+            return list(self._buf[:self._n])
+        h = self._head
+        return list(self._buf[h:]) + list(self._buf[:h])
+
+    def clear(self):
+        self.__init__(self.capacity)
+
+    @property
+    def mean(self):
+        return self._mean if self._n else None
+
+    @property
+    def variance(self):
+        if self._n < 2:
+            return None
+        return max(self._m2, 0.0) / (self._n - 1)
+
+    @property
+    def stdev(self):
+        var = self.variance
+        return None if var is None else math.sqrt(var)
+
+    @property
+    def slope(self):
+        """Least-squares change per sample."""
+        n = self._n
+        if n < 2:
+            return None
+        sx = n * (n - 1) / 2.0
+        sxx = (n - 1) * n * (2 * n - 1) / 6.0
+        return (n * self._sjy - sx * self._sy) / (n * sxx - sx * sx)
+
+    @property
+    def min(self):
+        return self._minq[0][1] if self._minq else None
+
+    @property
+    def max(self):
+        return self._maxq[0][1] if self._maxq else None
+
+# ==================== SOC estimator ====================
+class StableBatterySOC:
+    def __init__(self, history_samples=HISTORY_SAMPLES, curve=None):
+        self.curve = curve or SocCurve(DEFAULT_CURVE)
+
+        # Smoothing parameters
+        self.max_history_samples = history_samples
+        self.voltage_history = RollingStats(history_samples)
+        self.current_history = RollingStats(history_samples)
+        self.internal_resistance_ohms = 0.15  # 3S pack estimate
+
+    def interpolate_soc(self, voltage):
+        """Linear interpolation between lookup table points"""
+        return self.curve.soc(voltage)
+
+    def interpolate_trace(self, voltages):
+        """SOC for a recorded voltage trace (offline analysis)"""
+        return self.curve.soc_array(voltages)
+
+    def stable_voltage(self, readings):
+        """Trimmed mean of the most recent voltage readings"""
+        if not readings:
+            return None
+        if len(readings) >= 3:
+            # Remove highest and lowest reading
+            readings = sorted(readings)[1:-1]
+        return statistics.mean(readings)
+
+    def stable_current(self, readings):
+        """Mean of the most recent current readings"""
+        if not readings:
+            return None
+        return statistics.mean(readings)
+
+    def apply_load_compensation(self, voltage, current_ma):
+        """Compensate for voltage drop under load"""
+        if current_ma is None or voltage is None:
+            return voltage
+
+        current_amps = abs(current_ma) / 1000.0
+        compensated_voltage = voltage + (current_amps * self.internal_resistance_ohms)
+
+        return min(compensated_voltage, self.curve.v_max)
+
+    def update_history(self, voltage, current):
+        """Maintain rolling history for trend analysis"""
+        if voltage is not None:
+            self.voltage_history.push(voltage)
+        if current is not None:
+            self.current_history.push(current)
+
+    def get_voltage_trend(self):
+        """Fitted voltage change across the history window"""
+        hist = self.voltage_history
+        if len(hist) < 3:
+            return "stable"
+        change = hist.slope * (len(hist) - 1)
+
+        if change > TREND_DELTA_V:
+            return "rising"
+        if change < -TREND_DELTA_V:
+            return "falling"
+        return "stable"
+
+    def get_voltage_stability(self):
+        """Calculate voltage stability metric"""
+        if len(self.voltage_history) < 3:
+            return "unknown"
+
+        std_dev = self.voltage_history.stdev
+
+        if std_dev < 0.02:
+            return "very stable"
+        elif std_dev < 0.05:
+            return "stable"
+        elif std_dev < 0.10:
+            return "moderate"
+        else:
+            return "unstable"
+
+    def estimate(self, voltage_readings, current_readings):
+        """SOC from already-collected readings (no I2C, no sleeping)"""
+        voltage = self.stable_voltage(voltage_readings)
+        current_ma = self.stable_current(current_readings)
+        if voltage is None:
+            return {'error': 'No voltage readings'}
+
+        self.update_history(voltage, current_ma)
+        compensated_voltage = self.apply_load_compensation(voltage, current_ma)
+
+        return {
+            'soc_percent': self.interpolate_soc(compensated_voltage),
+            'voltage_raw': voltage,
+            'voltage_compensated': compensated_voltage,
+            'current_ma': current_ma,
+            'voltage_trend': self.get_voltage_trend(),
+            'voltage_stability': self.get_voltage_stability(),
+            'battery_type': self.curve.name
+        }
+
+# ==================== Coulomb counting ====================
+class CoulombSocEstimator:
+    """
+    Scalar EKF on SOC (%):
+    - predict: SOC -= I·dt / capacity (coulomb counting, trapezoid between
+      samples so a load step is not charged for the whole preceding gap)
+    - correct: measured load-compensated voltage vs OCV(SOC) from the curve,
+      H = dOCV/dSOC, with measurement noise growing with load current
+    Fixed work per sample (two bisects, a handful of flops), so it can run
+    at a low sampling rate and still give a steady percentage under throttle.
+    """
+    def __init__(self, curve, capacity_mah=CAPACITY_MAH, max_dt=MAX_DT):
+        self.curve = curve
+        self.capacity_mah = capacity_mah
+        self.max_dt = max_dt
+        self.soc = None
+        self.var = SOC_INIT_VAR
+        self._last_ts = None
+        self._last_amps = 0.0
+        self.updates = 0
+        self.over_budget = 0
+        self.update_us = RollingStats(100)
+
+    def update(self, voltage_comp, current_ma, ts):
+        t0 = time.perf_counter()
+        if self.soc is None:
+            self.soc = self.curve.soc(voltage_comp)
+            self.var = SOC_INIT_VAR
+            self._last_ts = ts
+            self._last_amps = abs(current_ma) / 1000.0
+            return self.soc
+
+        # Predict (the car only discharges; sign depends on shunt wiring)
+        dt = ts - self._last_ts if self._last_ts is not None else 0.0
+        self._last_ts = ts
+        amps = abs(current_ma) / 1000.0
+        prev_amps = self._last_amps
+        self._last_amps = amps
+        if 0.0 < dt <= self.max_dt:
+            self.soc -= 0.5 * (amps + prev_amps) * dt * 1000.0 / 3600.0 / self.capacity_mah * 100.0
+        self.var += SOC_PROCESS_VAR * max(dt, 0.0)
+
+        # Correct with the OCV curve
+        v_pred, h = self.curve.voltage(self.soc)
+        if h > 0.0:
+            r = OCV_VAR_REST + (OCV_SIGMA_PER_A * amps) ** 2
+            k = self.var * h / (h * h * self.var + r)
+            self.soc += k * (voltage_comp - v_pred)
+            self.var *= (1.0 - k * h)
+        self.soc = min(max(self.soc, 0.0), 100.0)
+
+        us = (time.perf_counter() - t0) * 1e6
+        self.update_us.push(us)
+        if us > UPDATE_BUDGET_US:
+            self.over_budget += 1
+        self.updates += 1
+        return self.soc
+
+    def get_state(self):
+        return (self.soc if self.soc is not None else -1.0, self.var)
+
+    def set_state(self, state):
+        soc, var = state
+        if 0.0 <= soc <= 100.0:
+            self.soc, self.var = soc, var
+
+    def stats(self):
+        return {
+            'battery.ekf_updates': float(self.updates),
+            'battery.ekf_update_us': self.update_us.mean or 0.0,
+            'battery.ekf_over_budget': float(self.over_budget),
+            'battery.ekf_sigma': math.sqrt(self.var),
+        }
+
+# ==================== INA219 reads ====================
+class Ina219Reader:
+    """
+    Lets the INA219 average ADC_AVERAGING samples per conversion, then reads
+    bus voltage, current and power back to back in one pass. The conversion-
+    ready (CNVR) bit in the bus voltage register skips passes with no new
+    data; the math-overflow (OVF) bit is counted.
+
+    adafruit_ina219 exposes only the 13-bit voltage field (`raw_bus_voltage`,
+    already shifted) and its `current`/`power` properties rewrite the
+    calibration register before every read (2 transactions each). Here the
+    whole bus voltage register is read in one write-then-read on the
+    driver's `i2c_device`, current and power come from `raw_current`/
+    `raw_power`, and calibration is rewritten every CAL_REFRESH passes:
+    3 transactions per pass with new data, 1 per stale pass. Drivers
+    without those attributes fall back to the public properties.
+    """
+    def __init__(self, ina219, averaging=ADC_AVERAGING):
+        self.ina = ina219
+        cls = type(ina219)
+        self._raw = (all(hasattr(cls, a) for a in ('raw_current', 'raw_power', '_raw_calibration'))
+                     and all(hasattr(ina219, a) for a in (
+                         'i2c_device', '_cal_value', '_current_lsb', '_power_lsb')))
+        self._reg = bytes((REG_BUSVOLTAGE,))
+        self._buf = bytearray(2)
+        self.transactions = 0
+        self.passes = 0
+        self.stale = 0        # no new conversion since the previous pass
+        self.overflows = 0    # OVF bit: current/power out of range
+        self.latency = RollingStats(100)
+        self.latency_max = 0.0
+        self._t_start = time.monotonic()
+        self.configure(averaging)
+
+    def configure(self, averaging):
+        try:
+            from adafruit_ina219 import ADCResolution
+            res = (ADCResolution.ADCRES_12BIT_1S if averaging <= 1 else
+                   getattr(ADCResolution, f'ADCRES_12BIT_{averaging}S'))
+            self.ina.bus_adc_resolution = res
+            self.ina.shunt_adc_resolution = res
+            self.transactions += 4   # two read-modify-writes of the config register
+            print(f"✓ INA219 hardware averaging: {averaging} samples")
+        except (ImportError, AttributeError) as e:
+            print(f"INA219 averaging not set ({e}); using driver defaults")
+
+    def _bus_voltage_register(self):
+        """Whole bus voltage register: V[15:3], CNVR bit 1, OVF bit 0."""
+        buf = self._buf
+        with self.ina.i2c_device as dev:
+            dev.write_then_readinto(self._reg, buf)
+        self.transactions += 1
+        return (buf[0] << 8) | buf[1]
+
+    def read(self):
+        """One pass -> (bus V, current mA, power W), or None if no new conversion."""
+        ina = self.ina
+        t0 = time.perf_counter()
+        if self._raw:
+            if self.passes % CAL_REFRESH == 0:
+                ina._raw_calibration = ina._cal_value
+                self.transactions += 1
+            reg = self._bus_voltage_register()
+            if not reg & 0x02:     # CNVR clear
+                self.stale += 1
+                self.passes += 1
+                return None
+            if reg & 0x01:         # OVF
+                self.overflows += 1
+            current = ina.raw_current * ina._current_lsb
+            power = ina.raw_power * ina._power_lsb   # reading power clears CNVR
+            self.transactions += 2
+            voltage = (reg >> 3) * 0.004
+        else:
+            voltage, current, power = ina.bus_voltage, ina.current, ina.power
+            self.transactions += 5
+        lat = time.perf_counter() - t0
+        self.latency.push(lat)
+        if lat > self.latency_max:
+            self.latency_max = lat
+        self.passes += 1
+        return voltage, current, power
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self._t_start, 1e-6)
+        mean = self.latency.mean
+        return {
+            'battery.i2c_transactions': float(self.transactions),
+            'battery.i2c_tx_per_s': self.transactions / elapsed,
+            'battery.read_passes': float(self.passes),
+            'battery.read_stale': float(self.stale),
+            'battery.read_overflows': float(self.overflows),
+            'battery.read_latency_ms': (mean or 0.0) * 1000.0,
+            'battery.read_latency_max_ms': self.latency_max * 1000.0,
+        }
+
+# ==================== Background sampler ====================
+class BatterySampler:
+    """
+    Reads the INA219 on its own thread into ring buffers and publishes a
+    smoothed estimate every publish_period. `latest` is replaced as a whole
+    dict, so readers on other threads get a consistent value without locks.
+    """
+    def __init__(self, ina219, soc=None, min_period=MIN_PERIOD, max_period=MAX_PERIOD,
+                 publish_period=PUBLISH_PERIOD, on_estimate=None, on_sample=None,
+                 averaging=ADC_AVERAGING, capacity_mah=CAPACITY_MAH):
+        self.reader = Ina219Reader(ina219, averaging)
+        self.soc = soc or StableBatterySOC()
+        self.min_period = min_period
+        self.max_period = max(max_period, min_period)
+        # Parked passes land slightly after max_period; leave headroom
+        self.ekf = CoulombSocEstimator(self.soc.curve, capacity_mah,
+                                       max_dt=MAX_DT_PERIODS * self.max_period)
+        self.period = min_period
+        self.publish_period = publish_period
+        self.on_estimate = on_estimate
+        self.on_sample = on_sample        # called with (ts, V, mA, W) for every raw sample
+        self.voltages = deque(maxlen=VOLTAGE_WINDOW)
+        self.currents = deque(maxlen=CURRENT_WINDOW)
+        self.last_sample = None   # (monotonic ts, V, mA, W)
+        self.latest = None
+        self.latest_ts = None
+        self.samples = 0
+        self.read_errors = 0
+        # adaptive rate counters
+        self.rate_hz = 1.0 / min_period   # EWMA of the effective sample rate
+        self.fast_passes = 0
+        self.idle_passes = 0
+        self._prev = None                 # (ts, current mA, EKF SOC)
+        self._soc_rate = 0.0              # smoothed |dSOC/dt|, %/s
+        self.loop = Periodic(min_period)  # absolute deadlines; period follows _adapt
+
+    def start(self):
+        threading.Thread(target=self.run, name='battery', daemon=True).start()
+        return self
+
+    def sample_once(self):
+        try:
+            sample = self.reader.read()
+            if sample is None:
+                return
+            voltage, current, power = sample
+            self.voltages.append(voltage)
+            self.currents.append(current)
+            now = time.monotonic()
+            self.last_sample = (now, voltage, current, power)
+            self.samples += 1
+            self.ekf.update(self.soc.apply_load_compensation(voltage, current), current, now)
+            self._adapt(now, current)
+            if self.on_sample:
+                self.on_sample(now, voltage, current, power)
+        except Exception as e:
+            self.read_errors += 1
+            if self.read_errors % 50 == 1:
+                print(f"INA219 read error: {e}")
+
+    def _adapt(self, now, current):
+        """
+        Pick the next interval between MIN and MAX_PERIOD (geometrically)
+        from the busiest of: load current, a current step since the last
+        pass, and the SOC rate. Shrinks at once, backs off by BACKOFF.
+        """
+        soc = self.ekf.soc
+        prev = self._prev
+        self._prev = (now, current, soc)
+        amps = abs(current)
+        activity = (amps - IDLE_CURRENT_MA) / (HIGH_CURRENT_MA - IDLE_CURRENT_MA)
+        if prev is not None:
+            dt = now - prev[0]
+            if abs(amps - abs(prev[1])) >= STEP_CURRENT_MA:
+                activity = 1.0
+            if dt > 0.0:
+                if soc is not None and prev[2] is not None:
+                    inst = abs(soc - prev[2]) / dt
+                    self._soc_rate += dt / (SOC_RATE_TAU + dt) * (inst - self._soc_rate)
+                    activity = max(activity, self._soc_rate / FAST_SOC_RATE)
+                self.rate_hz += 0.2 * (1.0 / dt - self.rate_hz)
+        activity = min(max(activity, 0.0), 1.0)
+
+        target = self.max_period * (self.min_period / self.max_period) ** activity
+        self.period = min(target, self.period * BACKOFF)
+        if self.period <= self.min_period * 1.01:
+            self.fast_passes += 1
+        elif self.period >= self.max_period * 0.9:
+            self.idle_passes += 1
+
+    def publish(self):
+        est = self.soc.estimate(list(self.voltages), list(self.currents))
+        if 'error' in est:
+            return None
+        if self.ekf.soc is not None:
+            est['soc_ocv'] = est['soc_percent']
+            est['soc_percent'] = self.ekf.soc
+            est['soc_sigma'] = math.sqrt(self.ekf.var)
+        self.latest = est
+        self.latest_ts = time.monotonic()
+        if self.on_estimate:
+            self.on_estimate(est)
+        return est
+
+    def run(self):
+        loop = self.loop
+        next_pub = time.monotonic()
+        while True:
+            loop.period = self.period
+            loop.tick()
+            self.sample_once()
+            now = time.monotonic()
+            if now >= next_pub:
+                self.publish()
+                next_pub += self.publish_period
+                if next_pub < now:
+                    next_pub = now + self.publish_period
+
+    def stats(self):
+        age = time.monotonic() - self.latest_ts if self.latest_ts else -1.0
+        out = {
+            'battery.samples': float(self.samples),
+            'battery.read_errors': float(self.read_errors),
+            'battery.estimate_age_s': age,
+            'battery.period_s': self.period,
+            'battery.rate_hz': self.rate_hz,
+            'battery.fast_passes': float(self.fast_passes),
+            'battery.idle_passes': float(self.idle_passes),
+        }
+        out.update(self.reader.stats())
+        out.update(self.ekf.stats())
+        out.update(self.loop.stats('battery.loop'))
+        return out
+
+# ==================== Offline trace analysis ====================
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Convert a recorded voltage trace to SOC (one voltage per line, or CSV column)')
+    parser.add_argument('trace', help='Input file, - for stdin')
+    parser.add_argument('--curve', default=None,
+                        help='Pack curve file or name in battery_curves/ (default: built-in 3S 18650)')
+    parser.add_argument('--column', type=int, default=0, help='CSV column holding the voltage')
+    args = parser.parse_args()
+
+    curve = load_curve(args.curve)
+    src = sys.stdin if args.trace == '-' else open(args.trace)
+    volts = []
+    with src:
+        for line in src:
+            fields = line.replace(',', ' ').split()
+            try:
+                volts.append(float(fields[args.column]))
+            except (IndexError, ValueError):
+                continue   # header or blank line
+    socs = curve.soc_array(volts)
+    for v, p in zip(volts, socs):
+        print(f"{v:.3f},{p:.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+CAN link statistics for the dashboard service:
+- Per-ID arrival gaps from kernel receive timestamps, so frames that sat
+  in the socket queue behind a slow reader keep their true spacing
+- late/missed/stalls vs socket drops and interface overruns tell
+  bus/Arduino problems apart from Pi-side throughput problems
+"""
+
+# ==================== Tunables ====================
+GAP_FACTOR = 1.5     # gap > 1.5 periods -> at least one frame missing
+STALL_GAP = 1.0      # gap > 1 s -> sender stalled (not counted as drops)
+
+IFACE_COUNTERS = ('rx_dropped', 'rx_over_errors', 'rx_fifo_errors', 'rx_errors')
+
+class CanLinkStats:
+    """
+    Tells throughput problems apart from sender/filter problems:
+    - socket_drops: kernel dropped frames because we read too slowly
+    - iface counters: controller/driver overruns (MCP2515 FIFO)
+    - late/missed: frames that never arrived although nothing was dropped
+      locally -> bus or Arduino side
+    - stalls: sender silent for longer than STALL_GAP
+    """
+    def __init__(self, iface=None, periods=None):
+        self.iface = iface
+        self.periods = dict(periods or {})   # msg id -> expected period (s)
+        self.frames = 0
+        self.error_frames = 0
+        self.socket_drops = 0                # SO_RXQ_OVFL counter (cumulative)
+        self.rx_idle = 0                     # recv timeouts with no frame
+        # msg id -> [count, last_ts, max_gap, late, missed, stalls]
+        self._ids = {}
+
+    def on_frame(self, msg_id, rx_ts):
+        """rx_ts: kernel receive time of the frame (not the time it was read)."""
+        self.frames += 1
+        st = self._ids.get(msg_id)
+        if st is None:
+            self._ids[msg_id] = [1, rx_ts, 0.0, 0, 0, 0]
+            return
+        gap = rx_ts - st[1]
+        st[0] += 1
+        st[1] = rx_ts
+        if gap > st[2]:
+            st[2] = gap
+        period = self.periods.get(msg_id)
+        if period and gap > period * GAP_FACTOR:
+            if gap > STALL_GAP:
+                st[5] += 1
+            else:
+                st[3] += 1
+                st[4] += int(round(gap / period)) - 1
+
+    def iface_counters(self):
+        out = {}
+        if not self.iface:
+            return out
+        base = f"/sys/class/net/{self.iface}/statistics/"
+        for name in IFACE_COUNTERS:
+            try:
+                with open(base + name) as f:
+                    out[name] = int(f.read())
+            except (OSError, ValueError):
+                pass
+        return out
+
+    def snapshot(self):
+        out = {
+            'can.frames': self.frames,
+            'can.error_frames': self.error_frames,
+            'can.socket_drops': self.socket_drops,
+            'can.rx_idle': self.rx_idle,
+        }
+        for name, val in self.iface_counters().items():
+            out[f'can.iface.{name}'] = val
+        for msg_id, (count, _, max_gap, late, missed, stalls) in list(self._ids.items()):
+            key = f'can.0x{msg_id:03X}'
+            out[f'{key}.count'] = count
+            out[f'{key}.max_gap_ms'] = max_gap * 1000.0
+            out[f'{key}.late'] = late
+            out[f'{key}.missed'] = missed
+            out[f'{key}.stalls'] = stalls
+        return {k: float(v) for k, v in out.items()}
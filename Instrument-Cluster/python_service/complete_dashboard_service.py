@@ -1,29 +1,45 @@
 #!/usr/bin/env python3
 """
 PiRacer dashboard D-Bus service with Kalman filter:
-- Reads speed over CAN (0x100: cm/s)
-- Smooths speed with a 2-state Kalman filter (v, a)
-- Reads battery % from INA219
+- Reads speed over CAN (0x100: cm/s, 0x101: encoder pulses + exact window)
+- Smooths speed with a 2-state Kalman filter (v, a) or an α–β filter,
+  switchable and tunable at runtime over D-Bus
+- Reads battery % from INA219 (background sampler, lookup-table SOC)
 - Exposes values via D-Bus + signals
 - Allows setting gear/turn signals via D-Bus
 - Auto-detects CAN interface (prefers can0 over can1)
+- Tracks CAN frame loss (socket overflow, per-ID arrival gaps)
+- Snapshots filter/battery state for warm restarts
+- Trip computer (distance, averages, Wh/km) as D-Bus properties
+- Keeps recent speed/battery samples for decimated GetHistory queries
+- Built-in sampling profiler (D-Bus or SIGUSR1) writing collapsed stacks
+- Optional GC pause / per-frame allocation instrumentation, gc.freeze()
+- Claims the bus name and starts CAN first; the INA219 stack loads in the background
 """
 
-import os
 import time
+_T0 = time.perf_counter()   # startup timing reference
+
+import os
+import gc
+import math
 import argparse
-import can
+import select
+import signal
+import socket
+import struct
+import threading
 import dbus
 import dbus.service
 import dbus.mainloop.glib
 from gi.repository import GLib
-import threading
-import numpy as np
+import can
+import rt_sched
+from can_link_stats import CanLinkStats
 
-# ---- INA219 (I2C) ----
-import board
-import busio
-from adafruit_ina219 import INA219
+# INA219 (board/busio/adafruit_ina219) is imported lazily by the battery thread,
+# numpy (sample_history) by the history loader thread
+_T_IMPORTS = time.perf_counter()
 
 # ==================== Tunables ====================
 DT0 = 0.05           # nominal period (s) if dt not measured
@@ -32,94 +48,526 @@ DT0 = 0.05           # nominal period (s) if dt not measured
 PROCESS_VAR = 4.0    # Reduced for more stable filtering
 MEAS_VAR = 3.0       # Increased to trust measurements less
 
-# Battery chemistry (3S Li-ion)
-MIN_VOLTAGE = 9.0
-MAX_VOLTAGE = 12.6
+# α–β alternative (Test_alpha_beta), selectable with --filter / SetFilterEngine
+ALPHA = 0.40         # measurement weight (0..1)
+BETA = 0.07          # acceleration correction
+FILTER_ENGINE = 'kalman'
+
+# Encoder geometry (must match SpeedToCAN.ino) for 0x101 interval frames
+PULSES_PER_TURN = 40
+WHEEL_DIAMETER_MM = 64
+CM_PER_PULSE = math.pi * (WHEEL_DIAMETER_MM / 10.0) / PULSES_PER_TURN
+MAX_SPEED_CMS = 300.0   # same spike guard as the Arduino
+INTERVAL_PREFER_S = 0.5 # ignore 0x100 while 0x101 frames keep arriving
+
+# Stale-speed watchdog (no 0x100 frame within the window)
+STALE_TIMEOUT = 0.5  # s
+STALE_MODE = 'decay' # 'decay' toward zero or force 'zero'
+STALE_DECAY = 0.7    # speed multiplier per watchdog tick while decaying
+WATCHDOG_PERIOD_MS = 100
+
+# CAN link monitoring
+SPEED_PERIOD = 0.05  # Arduino sends 0x100 every 50 ms
+STATS_PERIOD = 5     # --stats print interval (s)
+
+# Warm-restart snapshot
+SNAPSHOT_PATH = os.path.join(os.environ.get('XDG_RUNTIME_DIR', '/tmp'),
+                             'piracer_dashboard.snap')
+SNAPSHOT_PERIOD = 1      # s between snapshot writes
+SNAPSHOT_MAX_AGE = 30.0  # s; older snapshots are ignored on startup
+FILTER_SNAPSHOT_MAX_AGE = 1.0  # s; speed/accel and a converged P go stale fast
+HANDOVER_TIMEOUT = 2.0   # s to wait for the running instance's final snapshot
+
+# Trip computer
+MOVING_CMS = 2.0         # below this the car counts as stopped
+TRIP_SPEED_MAX_DT = 1.0  # s; longer speed gaps (sender stalled) are not integrated
+TRIP_PROPS_PERIOD = 1    # s between PropertiesChanged emissions
+# Persistent, unlike the tmpfs snapshot: a trip survives reboots
+TRIP_PATH = os.path.join(os.environ.get('XDG_STATE_HOME') or os.path.expanduser('~/.local/state'),
+                         'piracer', 'trip')
+TRIP_SAVE_PERIOD = 30    # s between trip file writes (only when changed; spares the SD card)
+
+# Sample history (GetHistory)
+HISTORY_SECONDS = 600.0  # s kept per field
+
+# Sampling profiler (StartProfiler/StopProfiler, SIGUSR1 toggles)
+PROFILE_RATE_HZ = 100.0  # stack samples per second across all threads
+PROFILE_DIR = os.path.dirname(SNAPSHOT_PATH)
 
 IFACE = 'com.piracer.dashboard'
+TRIP_IFACE = IFACE + '.Trip'
 OBJ = '/com/piracer/dashboard'
 
 # ==================== Kalman Filter ====================
 class KalmanSpeedFilter:
+    """
+    Constant-acceleration model, state [v, a]ᵀ, speed measured only.
+    The 2x2 matrix algebra is written out in scalars: cheaper per frame
+    than numpy on the Pi and keeps numpy off the startup path.
+    """
+    name = 'kalman'
+
     def __init__(self, dt=DT0, process_var=PROCESS_VAR, meas_var=MEAS_VAR):
-        # State: [v, a]ᵀ
-        self.x = np.zeros((2, 1))
-        self.P = np.eye(2) * 100.0  # Reduced initial uncertainty
-        self.dt = dt
+        self.process_var = process_var
+        self.meas_var = meas_var
+        self._set_dt(dt)
+        self.reset()
 
-        self.F = np.array([[1, dt],
-                           [0, 1]])
-        self.H = np.array([[1, 0]])      # only speed measured
-        self.R = np.array([[meas_var]])
-        self.Q = np.array([[dt**4/4, dt**3/2],
-                           [dt**3/2, dt**2]]) * process_var
+    def _set_dt(self, dt):
+        # Q = process_var * [[dt⁴/4, dt³/2], [dt³/2, dt²]]
+        self.dt = dt
+        q = self.process_var
+        self._q00 = q * dt**4 / 4.0
+        self._q01 = q * dt**3 / 2.0
+        self._q11 = q * dt**2
 
-    def update(self, z, dt=None):
+    def update(self, z, dt=None, r_scale=None):
+        """z: measured speed; dt: sample spacing; r_scale: this sample's variance / meas_var."""
         if dt is not None and abs(dt - self.dt) > 1e-3:
-            self.dt = dt
-            self.F = np.array([[1, dt],
-                               [0, 1]])
-            self.Q = np.array([[dt**4/4, dt**3/2],
-                               [dt**3/2, dt**2]]) * PROCESS_VAR
-
-        # Predict
-        self.x = self.F @ self.x
-        self.P = self.F @ self.P @ self.F.T + self.Q
-
-        # Update
-        y = np.array([[z]]) - self.H @ self.x
-        S = self.H @ self.P @ self.H.T + self.R
-        K = self.P @ self.H.T @ np.linalg.inv(S)
-        self.x = self.x + K @ y
-        self.P = (np.eye(2) - K @ self.H) @ self.P
+            self._set_dt(dt)
+        dt = self.dt
+
+        # Predict: x = F x, P = F P Fᵀ + Q with F = [[1, dt], [0, 1]]
+        v = self.v + dt * self.a
+        a = self.a
+        p01 = self.p01 + dt * self.p11
+        p00 = self.p00 + dt * self.p10 + dt * p01 + self._q00
+        p10 = self.p10 + dt * self.p11 + self._q01
+        p01 += self._q01
+        p11 = self.p11 + self._q11
+
+        # Update with H = [1, 0]
+        s = p00 + (self.meas_var if r_scale is None else self.meas_var * r_scale)
+        k0 = p00 / s
+        k1 = p10 / s
+        y = z - v
+        v += k0 * y
+        a += k1 * y
+        self.p00 = (1.0 - k0) * p00
+        self.p01 = (1.0 - k0) * p01
+        self.p10 = p10 - k1 * p00
+        self.p11 = p11 - k1 * p01
 
         # Clamp to non-negative
-        if self.x[0, 0] < 0.0:
-            self.x[0, 0] = 0.0
+        if v < 0.0:
+            v = 0.0
+        self.v = v
+        self.a = a
+        return v
+
+    def reset(self):
+        """Forget speed/accel history (e.g. after the sender went silent)."""
+        self.v = 0.0
+        self.a = 0.0
+        self.p00, self.p01, self.p10, self.p11 = 100.0, 0.0, 0.0, 100.0
+
+    def get_state(self):
+        """(v, a, P00, P01, P10, P11) as plain floats."""
+        return (self.v, self.a, self.p00, self.p01, self.p10, self.p11)
+
+    def set_state(self, state):
+        self.v, self.a, self.p00, self.p01, self.p10, self.p11 = map(float, state)
+
+    def params(self):
+        return {'process_var': self.process_var, 'meas_var': self.meas_var}
+
+    def set_params(self, params):
+        """Apply a subset of params(); ValueError leaves the filter unchanged."""
+        check_params(self, params, lambda p: p['process_var'] > 0 and p['meas_var'] > 0)
+        self.process_var = params.get('process_var', self.process_var)
+        self.meas_var = params.get('meas_var', self.meas_var)
+        self._set_dt(self.dt)
+
+# ==================== Alpha-beta Filter ====================
+class AlphaBetaSpeedFilter:
+    """
+    α–β filter on speed ("position" = speed, "velocity" = accel), ported
+    from Test_alpha_beta. Fixed gains, so cheaper than the Kalman filter
+    but blind to the per-sample variance of 0x101 frames.
+    """
+    name = 'alphabeta'
+
+    def __init__(self, dt=DT0, alpha=ALPHA, beta=BETA):
+        self.dt = dt
+        self.alpha = alpha
+        self.beta = beta
+        self.reset()
+
+    def update(self, z, dt=None, r_scale=None):
+        if dt is not None and dt > 0.0:
+            self.dt = dt
+        dt = self.dt
+        v_pred = self.v + self.a * dt
+        resid = z - v_pred
+        v = v_pred + self.alpha * resid
+        self.a += (self.beta / dt) * resid
+        if v < 0.0:
+            v = 0.0
+        self.v = v
+        return v
+
+    def reset(self):
+        self.v = 0.0
+        self.a = 0.0
+
+    def get_state(self):
+        return (self.v, self.a)
+
+    def set_state(self, state):
+        self.v, self.a = map(float, state[:2])
+
+    def params(self):
+        return {'alpha': self.alpha, 'beta': self.beta}
+
+    def set_params(self, params):
+        # Stability region of the α–β tracker: 0 < α, 0 < β < 4 - 2α
+        check_params(self, params,
+                     lambda p: 0 < p['alpha'] <= 1 and 0 < p['beta'] < 4 - 2 * p['alpha'])
+        self.alpha = params.get('alpha', self.alpha)
+        self.beta = params.get('beta', self.beta)
+
+FILTER_ENGINES = {cls.name: cls for cls in (KalmanSpeedFilter, AlphaBetaSpeedFilter)}
+
+def carry_filter_state(filt, state):
+    """Load a saved/previous filter state; across engines only (v, a) carry over."""
+    if len(state) == len(filt.get_state()):
+        filt.set_state(state)
+    else:
+        filt.reset()
+        filt.v, filt.a = float(state[0]), float(state[1])
+
+def check_params(filt, params, valid):
+    """Reject unknown names and values outside the filter's valid region."""
+    merged = filt.params()
+    unknown = set(params) - set(merged)
+    if unknown:
+        raise ValueError(f"unknown {filt.name} parameter(s): {', '.join(sorted(unknown))} "
+                         f"(use {', '.join(merged)})")
+    merged.update(params)
+    if not all(math.isfinite(v) for v in merged.values()) or not valid(merged):
+        raise ValueError(f"invalid {filt.name} parameters: {params}")
+
+# ==================== Snapshot file ====================
+# Header: magic, version, wall-clock time; then tagged sections
+# (4-byte tag, uint16 length, payload) so new state can be appended
+# without breaking older readers.
+SNAPSHOT_MAGIC = b'PRSN'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HDR = struct.Struct('<4sHd')
+SNAPSHOT_SEC = struct.Struct('<4sH')
+SNAPSHOT_SEC_MAX = 0xFFFF                  # payload bytes a section length can describe
+KALMAN_STATE = struct.Struct('<6d')
+AB_STATE = struct.Struct('<2d')            # α–β filter v, a
+BATTERY_STATE = struct.Struct('<d')
+DOUBLE = struct.Struct('<d')
+BATTERY_EKF_STATE = struct.Struct('<2d')   # SOC %, variance
+TRIP_STATE = struct.Struct('<5d')          # see TripComputer.get_state
 
-        return float(self.x[0, 0])
+def write_snapshot(path, sections):
+    buf = [SNAPSHOT_HDR.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, time.time())]
+    for tag, payload in sections.items():
+        buf.append(SNAPSHOT_SEC.pack(tag, len(payload)))
+        buf.append(payload)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(b''.join(buf))
+    os.replace(tmp, path)   # atomic: readers never see a partial file
+
+def read_snapshot(path):
+    """Return (age_s, {tag: payload}) or None if missing/corrupt."""
+    try:
+        with open(path, 'rb') as f:
+            blob = f.read()
+        magic, version, ts = SNAPSHOT_HDR.unpack_from(blob)
+    except (OSError, struct.error):
+        return None
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        return None
+    sections = {}
+    off = SNAPSHOT_HDR.size
+    while off + SNAPSHOT_SEC.size <= len(blob):
+        tag, n = SNAPSHOT_SEC.unpack_from(blob, off)
+        off += SNAPSHOT_SEC.size
+        sections[tag] = blob[off:off + n]
+        off += n
+    return time.time() - ts, sections
+
+def interval_var_scale(pulses, window_s):
+    """
+    Measurement variance of a 0x101 sample relative to MEAS_VAR. Pulse
+    counting is exact up to the phase of the first/last edge (triangular,
+    1/6 pulse²); an empty window only says "less than one pulse" (uniform,
+    1/3 pulse²). A full nominal 50 ms window gives 1.0, i.e. the tuned
+    meas_var, whatever it is currently set to.
+    """
+    q = CM_PER_PULSE / window_s
+    var = q * q / (6.0 if pulses else 3.0)
+    return var / ((CM_PER_PULSE / DT0) ** 2 / 6.0)
+
+# ==================== Trip computer ====================
+class TripComputer:
+    """
+    Running trip totals, O(1) per sample: distance and energy are
+    trapezoid-integrated from the filtered speed (CAN thread) and the
+    INA219 power reading (battery thread). Gaps longer than the max dt
+    (sender stalled, service stopped) are skipped rather than bridged.
+    The power max dt follows the battery sampler's slowest interval, so
+    the battery thread sets it once the sampler exists.
+    """
+    def __init__(self, power_max_dt=None):
+        self._lock = threading.Lock()   # reset/restore vs the two feeder threads
+        self.power_max_dt = power_max_dt
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.distance_cm = 0.0
+            self.elapsed_s = 0.0
+            self.moving_s = 0.0
+            self.max_speed = 0.0
+            self.energy_wh = 0.0
+            self._speed_prev = None   # (ts, cm/s)
+            self._power_prev = None   # (ts, W)
+
+    def add_speed(self, ts, v_cms):
+        with self._lock:
+            prev = self._speed_prev
+            self._speed_prev = (ts, v_cms)
+            if v_cms > self.max_speed:
+                self.max_speed = v_cms
+            if prev is None:
+                return
+            dt = ts - prev[0]
+            if not 0.0 < dt <= TRIP_SPEED_MAX_DT:
+                return
+            v = 0.5 * (v_cms + prev[1])
+            self.distance_cm += v * dt
+            self.elapsed_s += dt
+            if v >= MOVING_CMS:
+                self.moving_s += dt
+
+    def add_power(self, ts, watts):
+        with self._lock:
+            prev = self._power_prev
+            self._power_prev = (ts, watts)
+            if prev is None:
+                return
+            dt = ts - prev[0]
+            max_dt = self.power_max_dt
+            if max_dt is not None and 0.0 < dt <= max_dt:
+                self.energy_wh += 0.5 * (watts + prev[1]) * dt / 3600.0
+
+    def properties(self):
+        """Trip values in display units (m, s, cm/s, Wh, Wh/km)."""
+        with self._lock:
+            dist, moving, energy = self.distance_cm, self.moving_s, self.energy_wh
+            elapsed, vmax = self.elapsed_s, self.max_speed
+        km = dist / 1e5
+        return {
+            'Distance': dist / 100.0,
+            'ElapsedTime': elapsed,
+            'MovingTime': moving,
+            'AverageSpeed': dist / moving if moving > 0.0 else 0.0,
+            'MaxSpeed': vmax,
+            'Energy': energy,
+            'WhPerKm': energy / km if km >= 0.001 else 0.0,   # from 1 m on
+        }
+
+    def get_state(self):
+        """(distance cm, elapsed s, moving s, max cm/s, energy Wh)."""
+        with self._lock:
+            return (self.distance_cm, self.elapsed_s, self.moving_s,
+                    self.max_speed, self.energy_wh)
+
+    def set_state(self, state):
+        with self._lock:
+            (self.distance_cm, self.elapsed_s, self.moving_s,
+             self.max_speed, self.energy_wh) = map(float, state)
+            self._speed_prev = self._power_prev = None
+
+# ==================== SocketCAN receive ====================
+# SocketCAN raw frame layout and ancillary data (see linux/can.h)
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40)
+SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35)
+CAN_EFF_FLAG = 0x80000000
+CAN_RTR_FLAG = 0x40000000
+CAN_ERR_FLAG = 0x20000000
+CAN_EFF_MASK = 0x1FFFFFFF
+CANFD_MTU = 72
+CAN_FRAME_HDR = struct.Struct('=IB3x')
+RXQ_OVFL_STRUCT = struct.Struct('=I')
+TIMESPEC_STRUCT = struct.Struct('@ll')
+ANC_BUFSIZE = socket.CMSG_SPACE(RXQ_OVFL_STRUCT.size) + socket.CMSG_SPACE(TIMESPEC_STRUCT.size)
+
+# ==================== Startup timing ====================
+class StartupTimer:
+    """Phase marks relative to process start (_T0); safe to call from any thread."""
+    def __init__(self):
+        self.marks = [('imports (dbus, GLib, python-can)', _T_IMPORTS)]
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        with self._lock:
+            self.marks.append((name, time.perf_counter()))
+
+    def once(self, name):
+        with self._lock:
+            if any(n == name for n, _ in self.marks):
+                return
+            self.marks.append((name, time.perf_counter()))
+
+    def has(self, name):
+        return any(n == name for n, _ in self.marks)
+
+    def report(self):
+        print("Startup timing:")
+        prev = _T0
+        for name, t in sorted(self.marks, key=lambda m: m[1]):
+            print(f"  {(t - _T0) * 1000:8.1f} ms  (+{(t - prev) * 1000:7.1f})  {name}")
+            prev = t
+
+STARTUP_REPORT_TIMEOUT = 10.0  # s; report even if some phases never happen
 
 # ==================== Service ====================
 class CompleteDashboardService(dbus.service.Object):
-    def __init__(self, can_iface: str = "auto", debug=False):
+    def __init__(self, can_iface: str = "auto", debug=False, stats=False,
+                 stale_timeout=STALE_TIMEOUT, stale_mode=STALE_MODE,
+                 snapshot_path=SNAPSHOT_PATH, snapshot_max_age=SNAPSHOT_MAX_AGE,
+                 trip_path=TRIP_PATH,
+                 startup_timing=False, battery_history=None, battery_curve=None,
+                 battery_averaging=None, battery_capacity=None,
+                 battery_min_interval=None, battery_max_interval=None,
+                 history_seconds=HISTORY_SECONDS, filter_engine=FILTER_ENGINE,
+                 can_policy=None, profile_rate=PROFILE_RATE_HZ, profile_dir=PROFILE_DIR,
+                 gc_stats=False, alloc_trace=False, gc_freeze=False):
         self.debug = debug
+        self.gc_freeze = gc_freeze
+        # Diagnostics only: gc_monitor (and tracemalloc) are not imported otherwise
+        self.gc_monitor = None
+        self.alloc_tracer = None
+        if gc_stats:
+            from gc_monitor import GcMonitor
+            self.gc_monitor = GcMonitor().install()
+        if alloc_trace:
+            from gc_monitor import AllocTracer
+            # Snapshot diffs limited to the CAN path: this service and python-can
+            self.alloc_tracer = AllocTracer((os.path.abspath(__file__),
+                                             os.path.join(os.path.dirname(can.__file__), '*')))
+        self.profile_rate = profile_rate
+        self.profile_dir = profile_dir
+        self.profiler = None
+        self.can_policy = can_policy   # rt_sched.ThreadPolicy for the CAN receive thread
+        self.history_seconds = history_seconds
+        self.battery_intervals = (battery_min_interval, battery_max_interval)
+        self.battery_capacity = battery_capacity
+        self.battery_averaging = battery_averaging
+        self.battery_history = battery_history
+        self.battery_curve = battery_curve
+        self._timing = StartupTimer() if startup_timing else None
+        self.snapshot_path = snapshot_path
+        self.trip_path = trip_path
+        self.mainloop = None
+        self.stale_timeout = stale_timeout
+        self.stale_mode = stale_mode
         dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
         bus = dbus.SessionBus()
+        if self.snapshot_path or self.trip_path:
+            self._request_handover_snapshot(bus)
         bus_name = dbus.service.BusName(
             IFACE, bus=bus,
             allow_replacement=True, replace_existing=True, do_not_queue=True
         )
         super().__init__(bus_name, OBJ)
+        # Another instance took the name over (replace_existing): hand it our state
+        bus.add_signal_receiver(self._on_name_lost, signal_name='NameLost',
+                                dbus_interface='org.freedesktop.DBus',
+                                bus_name='org.freedesktop.DBus')
+        self._mark('bus name claimed')
 
         # State
         self.current_speed = 0.0
         self.battery_level = 0.0
+        self.battery = None               # BatterySampler, created on the battery thread
+        self._battery_restore = {}        # snapshot sections applied once the sampler exists
         self.current_gear = 'P'
         self.turn_mode = 'off'
         self.connected = False
 
-        self._speed_filt = KalmanSpeedFilter()
+        self._speed_filt = FILTER_ENGINES[filter_engine]()
+        self._filt_lock = threading.Lock()   # CAN thread update vs D-Bus swap/retune
+        self._reset_filter_cost()
         self._last_speed_ts = None
+        self._last_speed_rx = None      # kernel receive time of that frame
+        self._last_interval_ts = None   # last 0x101 frame (preferred over 0x100)
+        self.trip = TripComputer()
+        self._trip_sent = {}            # last values sent in PropertiesChanged
+        self._trip_saved = None         # state last written to trip_path
+        self.history = None             # SampleHistory once numpy has loaded
+        self._loading = {'battery', 'history'} if history_seconds > 0 else {'battery'}
 
         # CAN
         self.can_bus = None
+        self.can_iface = None
+        self._can_sock = None
         self.connected = self._open_can(can_iface)
         if not self.connected:
             print("CAN connection failed; exiting init")
             return
+        self.can_stats = CanLinkStats(self.can_iface, {0x100: SPEED_PERIOD, 0x101: SPEED_PERIOD})
+        self._can_sock = self._enable_rxq_ovfl()
+        self._mark('CAN open')
 
-        # INA219
-        try:
-            self.i2c_bus = busio.I2C(board.SCL, board.SDA)
-            self.ina219 = INA219(self.i2c_bus, 0x41)
-            print("✓ INA219 ready (0x41)")
-        except Exception as e:
-            print(f"INA219 init failed: {e}")
-            self.ina219 = None
+        if self.snapshot_path:
+            self._restore_snapshot(snapshot_max_age)
+        if self.trip_path:
+            self._load_trip()
+
+        # CAN ingest first; the INA219 stack (board/busio/adafruit) is slow to
+        # import on a cold Pi, so it loads on the battery thread
+        self.ina219 = None
+        threading.Thread(target=self.read_can_data, name='can-rx', daemon=True).start()
+        self._mark('CAN thread started')
+        threading.Thread(target=self._battery_worker, name='battery', daemon=True).start()
+        if self.history_seconds > 0:
+            threading.Thread(target=self._init_history, name='history-init', daemon=True).start()
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR1, self._toggle_profiler)
+        if self._timing:
+            GLib.idle_add(self._mark, 'main loop running')
+            GLib.timeout_add(200, self._startup_report)
+        GLib.timeout_add(WATCHDOG_PERIOD_MS, self._speed_watchdog)
+        if stats:
+            GLib.timeout_add_seconds(STATS_PERIOD, self._print_stats)
+        if self.snapshot_path:
+            GLib.timeout_add_seconds(SNAPSHOT_PERIOD, self._save_snapshot)
+        if self.trip_path:
+            GLib.timeout_add_seconds(TRIP_SAVE_PERIOD, self._save_trip)
+        GLib.timeout_add_seconds(TRIP_PROPS_PERIOD, self._emit_trip_changes)
 
-        # Threads
-        threading.Thread(target=self.read_can_data, daemon=True).start()
-        threading.Thread(target=self.poll_battery, daemon=True).start()
+    # ---------- Startup timing ----------
+    def _loader_done(self, name):
+        """GLib thread: a background loader finished (or gave up)."""
+        self._loading.discard(name)
+        if not self._loading and self.gc_freeze:
+            # Startup objects (modules, D-Bus proxies, curves, history
+            # buffers) never die; move them out of the collector's view
+            gc.collect()
+            gc.freeze()
+            print(f"✓ gc.freeze(): {gc.get_freeze_count()} startup objects frozen")
+        return False
+
+    def _mark(self, name):
+        if self._timing:
+            self._timing.once(name)
+        return False
+
+    def _startup_report(self):
+        t = self._timing
+        done = t.has('first SpeedChanged') and t.has('first battery sample')
+        if not done and time.perf_counter() - _T0 < STARTUP_REPORT_TIMEOUT:
+            return True
+        t.report()
+        self._timing = None
+        return False
 
     # ---------- CAN open ----------
     def _open_can(self, iface: str) -> bool:
@@ -138,6 +586,7 @@ class CompleteDashboardService(dbus.service.Object):
         for ifc in candidates:
             try:
                 self.can_bus = can.interface.Bus(channel=ifc, bustype='socketcan')
+                self.can_iface = ifc
                 print(f"✓ CAN connected ({ifc})")
                 return True
             except Exception as e:
@@ -146,6 +595,55 @@ class CompleteDashboardService(dbus.service.Object):
             print(f"✗ CAN open failed {ifc}: {err}")
         return False
 
+    def _enable_rxq_ovfl(self):
+        """
+        Ask the kernel to report socket receive-queue drops and its receive
+        timestamp with every frame (_recv_raw reads both).
+        """
+        sock = getattr(self.can_bus, 'socket', None)
+        if sock is None:
+            return None
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+        except OSError as e:
+            print(f"SO_RXQ_OVFL unavailable, drop counter disabled: {e}")
+            return None
+        try:
+            # python-can sets this too, but _recv_raw must not depend on it
+            sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        except OSError as e:
+            print(f"SO_TIMESTAMPNS unavailable, frames stamped on receipt: {e}")
+        return sock
+
+    def _recv_raw(self, timeout):
+        """
+        recvmsg() on the socketcan socket directly; python-can rejects the
+        extra SO_RXQ_OVFL ancillary field, so frames are dissected here.
+        """
+        sock = self._can_sock
+        if not select.select((sock,), (), (), timeout)[0]:
+            return None
+        cf, ancdata, _, _ = sock.recvmsg(CANFD_MTU, ANC_BUFSIZE)
+        ts = time.time()
+        for level, ctype, cdata in ancdata:
+            if level != socket.SOL_SOCKET:
+                continue
+            if ctype == SO_RXQ_OVFL and len(cdata) >= RXQ_OVFL_STRUCT.size:
+                self.can_stats.socket_drops = RXQ_OVFL_STRUCT.unpack_from(cdata)[0]
+            elif ctype == SO_TIMESTAMPNS and len(cdata) >= TIMESPEC_STRUCT.size:
+                sec, nsec = TIMESPEC_STRUCT.unpack_from(cdata)
+                ts = sec + nsec * 1e-9
+        can_id, dlc = CAN_FRAME_HDR.unpack_from(cf)
+        return can.Message(
+            timestamp=ts,
+            arbitration_id=can_id & CAN_EFF_MASK,
+            is_extended_id=bool(can_id & CAN_EFF_FLAG),
+            is_remote_frame=bool(can_id & CAN_RTR_FLAG),
+            is_error_frame=bool(can_id & CAN_ERR_FLAG),
+            dlc=dlc,
+            data=cf[8:8 + dlc],
+        )
+
     # ---------- D-Bus Methods ----------
     @dbus.service.method(IFACE, out_signature='d')
     def GetSpeed(self):
@@ -155,6 +653,15 @@ class CompleteDashboardService(dbus.service.Object):
     def GetBatteryLevel(self):
         return float(self.battery_level)
 
+    @dbus.service.method(IFACE, out_signature='a{sv}')
+    def GetBatteryInfo(self):
+        """Latest cached estimate: SOC, raw/compensated voltage, current, trend."""
+        est = self.battery.latest if self.battery is not None else None
+        if not est:
+            return dbus.Dictionary({}, signature='sv')
+        return dbus.Dictionary({k: v for k, v in est.items() if v is not None},
+                               signature='sv')
+
     @dbus.service.method(IFACE, out_signature='s')
     def GetGear(self):
         return str(self.current_gear)
@@ -181,6 +688,118 @@ class CompleteDashboardService(dbus.service.Object):
     def GetTurnSignal(self):
         return str(self.turn_mode)
 
+    @dbus.service.method(IFACE, out_signature='a{sd}')
+    def GetStats(self):
+        return self._collect_stats()
+
+    @dbus.service.method(IFACE, in_signature='sdu', out_signature='adadadad')
+    def GetHistory(self, field, seconds, max_points):
+        """
+        Last `seconds` of speed/battery/voltage/current/power (0 = all kept),
+        min/max/mean-decimated to at most max_points (0 = service cap).
+        Returns (t, min, max, mean); t is seconds relative to now (<= 0).
+        """
+        hist = self.history
+        if hist is None:
+            raise dbus.DBusException('History not available (numpy missing or still loading)')
+        try:
+            arrays = hist.query(str(field), time.monotonic(), float(seconds), int(max_points))
+        except KeyError:
+            raise dbus.DBusException(f'Unknown field {field!r} (use {"/".join(hist.rings)})')
+        return tuple(dbus.Array(a.tolist(), signature='d') for a in arrays)
+
+    @dbus.service.method(IFACE, out_signature='s')
+    def GetFilterEngine(self):
+        return self._speed_filt.name
+
+    @dbus.service.method(IFACE, in_signature='s', out_signature='')
+    def SetFilterEngine(self, engine):
+        """Swap speed filters between frames; speed and acceleration carry over."""
+        engine = str(engine).lower()
+        if engine not in FILTER_ENGINES:
+            raise dbus.DBusException(f"Unknown filter engine (use {'/'.join(FILTER_ENGINES)})")
+        with self._filt_lock:
+            old = self._speed_filt
+            if old.name == engine:
+                return
+            # Through the constructor: the Kalman Q matrix is built for this dt
+            new = FILTER_ENGINES[engine](dt=old.dt)
+            carry_filter_state(new, old.get_state())
+            self._speed_filt = new
+            self._reset_filter_cost()
+        print(f"[Dash] Speed filter -> {engine} {new.params()}")
+
+    @dbus.service.method(IFACE, out_signature='a{sd}')
+    def GetFilterParams(self):
+        """Tunables of the active engine plus its per-update cost (µs) since the last change."""
+        with self._filt_lock:
+            out = self._speed_filt.params()
+            out.update(self._filter_cost())
+        return out
+
+    @dbus.service.method(IFACE, in_signature='a{sd}', out_signature='a{sd}')
+    def SetFilterParams(self, params):
+        """Retune the active engine (e.g. {'meas_var': 5.0}); state is kept."""
+        params = {str(k): float(v) for k, v in params.items()}
+        with self._filt_lock:
+            filt = self._speed_filt
+            try:
+                filt.set_params(params)
+            except ValueError as e:
+                raise dbus.DBusException(str(e))
+            self._reset_filter_cost()
+            out = filt.params()
+        print(f"[Dash] {filt.name} params -> {out}")
+        return out
+
+    @dbus.service.method(IFACE, in_signature='d', out_signature='')
+    def StartProfiler(self, rate_hz):
+        """Start sampling all threads at rate_hz (0 = default); no-op if running."""
+        self._start_profiler(float(rate_hz) or self.profile_rate)
+
+    @dbus.service.method(IFACE, out_signature='s')
+    def StopProfiler(self):
+        """Stop sampling; returns the collapsed-stack file written ('' if not running)."""
+        return self._stop_profiler()
+
+    @dbus.service.method(IFACE, out_signature='b')
+    def SaveSnapshot(self):
+        """Write the snapshot and trip file now; a replacing instance calls this before taking the name."""
+        if not (self.snapshot_path or self.trip_path):
+            return False
+        self._save_snapshot()
+        self._save_trip()
+        return True
+
+    @dbus.service.method(TRIP_IFACE, out_signature='')
+    def ResetTrip(self):
+        self.trip.reset()
+        print("[Dash] Trip reset")
+        self._emit_trip_changes()
+        self._save_trip()
+
+    # ---------- D-Bus Properties (Trip) ----------
+    @dbus.service.method(dbus.PROPERTIES_IFACE, in_signature='ss', out_signature='v')
+    def Get(self, interface, prop):
+        props = self.GetAll(interface)
+        if prop not in props:
+            raise dbus.DBusException(f'No such property {prop}',
+                                     name='org.freedesktop.DBus.Error.UnknownProperty')
+        return props[prop]
+
+    @dbus.service.method(dbus.PROPERTIES_IFACE, in_signature='s', out_signature='a{sv}')
+    def GetAll(self, interface):
+        if interface not in ('', TRIP_IFACE):
+            raise dbus.DBusException(f'No properties on {interface}',
+                                     name='org.freedesktop.DBus.Error.UnknownInterface')
+        return dbus.Dictionary({k: dbus.Double(v) for k, v in self.trip.properties().items()},
+                               signature='sv')
+
+    @dbus.service.method(dbus.PROPERTIES_IFACE, in_signature='ssv', out_signature='')
+    def Set(self, interface, prop, value):
+        raise dbus.DBusException(f'{prop} is read-only (use ResetTrip)',
+                                 name='org.freedesktop.DBus.Error.PropertyReadOnly')
+
     # ---------- D-Bus Signals ----------
     @dbus.service.signal(IFACE, signature='d')
     def SpeedChanged(self, new_speed):
@@ -198,10 +817,16 @@ class CompleteDashboardService(dbus.service.Object):
     def TurnSignalChanged(self, mode):
         pass
 
+    @dbus.service.signal(dbus.PROPERTIES_IFACE, signature='sa{sv}as')
+    def PropertiesChanged(self, interface, changed, invalidated):
+        pass
+
     # ---------- Emit helpers ----------
     def _emit_speed(self, v_cms):
         self.current_speed = max(0.0, v_cms)
         self.SpeedChanged(self.current_speed)
+        if self._timing:
+            self._timing.once('first SpeedChanged')
         return False
 
     def _emit_batt(self, v_percent):
@@ -214,64 +839,439 @@ class CompleteDashboardService(dbus.service.Object):
         self.GearChanged(g)
         return False
 
+    def _emit_trip_changes(self):
+        """GLib timer: one PropertiesChanged with the trip values that moved."""
+        props = self.trip.properties()
+        changed = {k: dbus.Double(v) for k, v in props.items()
+                   if self._trip_sent.get(k) != v}
+        if changed:
+            self._trip_sent = props
+            self.PropertiesChanged(TRIP_IFACE, dbus.Dictionary(changed, signature='sv'),
+                                   dbus.Array([], signature='s'))
+        return True
+
+    # ---------- Warm-restart snapshot ----------
+    def _snapshot_sections(self):
+        return {
+            **self._pack_filter_state(),
+            b'BATT': BATTERY_STATE.pack(self.battery_level),
+            b'BHIS': self._pack_battery_history(),
+            b'BEKF': self._pack_battery_ekf(),
+        }
+
+    def _save_snapshot(self):
+        if not self.snapshot_path:
+            return False
+        try:
+            write_snapshot(self.snapshot_path, self._snapshot_sections())
+        except (OSError, struct.error) as e:
+            print(f"Snapshot write failed: {e}")
+        return True
+
+    def _request_handover_snapshot(self, bus):
+        """
+        Before replacing a running instance, have it write its latest state:
+        its NameLost save would land only after our restore has read the file.
+        """
+        if not bus.name_has_owner(IFACE):
+            return
+        try:
+            saved = bus.call_blocking(IFACE, OBJ, IFACE, 'SaveSnapshot', '', (),
+                                      timeout=HANDOVER_TIMEOUT)
+        except dbus.DBusException as e:
+            print(f"Running instance did not save a snapshot: {e.get_dbus_message()}")
+            return
+        if saved:
+            print("✓ Running instance saved its snapshot for the handover")
+
+    def _restore_snapshot(self, max_age):
+        snap = read_snapshot(self.snapshot_path)
+        if snap is None:
+            return
+        age, sections = snap
+        if not 0.0 <= age <= max_age:
+            print(f"Snapshot ignored (age {age:.1f}s)")
+            return
+        try:
+            # A converged filter (small P) would trust an old speed for a long
+            # time; only carry it over a handover or a quick restart
+            if age <= FILTER_SNAPSHOT_MAX_AGE:
+                for tag, fmt in ((b'KALM', KALMAN_STATE), (b'ABST', AB_STATE)):
+                    if tag in sections:
+                        carry_filter_state(self._speed_filt, fmt.unpack(sections[tag]))
+            else:
+                print(f"Speed filter state not restored (age {age:.1f}s > "
+                      f"{FILTER_SNAPSHOT_MAX_AGE:.1f}s)")
+            if b'BATT' in sections:
+                self.battery_level = BATTERY_STATE.unpack(sections[b'BATT'])[0]
+                GLib.idle_add(self.BatteryChanged, self.battery_level)
+            for tag in (b'BHIS', b'BEKF'):
+                if sections.get(tag):
+                    self._battery_restore[tag] = sections[tag]
+        except struct.error as e:
+            print(f"Snapshot corrupt: {e}")
+            return
+        print(f"✓ Restored state from snapshot ({age:.1f}s old)")
+
+    # ---------- Trip file ----------
+    def _save_trip(self):
+        """GLib timer: write the trip (same tagged format as the snapshot) if it changed."""
+        if not self.trip_path:
+            return False
+        state = self.trip.get_state()
+        if state == self._trip_saved:
+            return True
+        try:
+            os.makedirs(os.path.dirname(self.trip_path) or '.', exist_ok=True)
+            write_snapshot(self.trip_path, {b'TRIP': TRIP_STATE.pack(*state)})
+            self._trip_saved = state
+        except OSError as e:
+            print(f"Trip file write failed: {e}")
+        return True
+
+    def _load_trip(self):
+        # The trip is an odometer, not live state: keep it however old
+        snap = read_snapshot(self.trip_path)
+        if snap is None:
+            return
+        payload = snap[1].get(b'TRIP', b'')
+        if len(payload) == TRIP_STATE.size:
+            self.trip.set_state(TRIP_STATE.unpack(payload))
+            self._trip_saved = self.trip.get_state()
+            print(f"✓ Restored trip from {self.trip_path}")
+
+    def _pack_filter_state(self):
+        with self._filt_lock:
+            filt = self._speed_filt
+            state = filt.get_state()
+        if filt.name == 'kalman':
+            return {b'KALM': KALMAN_STATE.pack(*state)}
+        return {b'ABST': AB_STATE.pack(*state)}
+
+    def _on_name_lost(self, name):
+        if name != IFACE:
+            return
+        print("[Dash] Bus name taken over; saving snapshot and exiting")
+        self._save_snapshot()
+        self._save_trip()
+        self.snapshot_path = None   # stop competing with the new instance
+        self.trip_path = None
+        if self.mainloop is not None:
+            self.mainloop.quit()
+
+    # ---------- Stale-speed watchdog ----------
+    def _speed_watchdog(self):
+        """
+        GLib timer: pull the gauge down when 0x100 frames stop arriving.
+        The CAN thread resets the filter itself when frames resume, so the
+        per-frame path only pays for one timestamp comparison.
+        """
+        last = self._last_speed_ts
+        if self.current_speed <= 0.0 or last is None:
+            return True
+        if time.monotonic() - last < self.stale_timeout:
+            return True
+        v = self.current_speed * STALE_DECAY if self.stale_mode == 'decay' else 0.0
+        if v < 0.5:
+            v = 0.0
+        if self.debug:
+            print(f"Stale speed ({time.monotonic() - last:.2f}s): {self.current_speed:5.1f} -> {v:5.1f}")
+        self._emit_speed(v)
+        return True
+
+    # ---------- Stats ----------
+    def _reset_filter_cost(self):
+        self._filt_updates = 0
+        self._filt_ns_sum = 0
+        self._filt_ns_max = 0
+        self._filt_ns_last = 0
+
+    def _filter_cost(self):
+        n = self._filt_updates
+        return {
+            'updates': float(n),
+            'update_us': self._filt_ns_last / 1e3,
+            'update_us_avg': self._filt_ns_sum / n / 1e3 if n else 0.0,
+            'update_us_max': self._filt_ns_max / 1e3,
+        }
+
+    def _collect_stats(self):
+        out = self.can_stats.snapshot()
+        out.update({f'filter.{k}': v for k, v in self._filter_cost().items()})
+        if self.battery is not None:
+            out.update(self.battery.stats())
+        if self.history is not None:
+            out.update(self.history.stats())
+        if self.profiler is not None:
+            out.update(self.profiler.stats())
+        if self.gc_monitor is not None:
+            out.update(self.gc_monitor.stats())
+        if self.alloc_tracer is not None:
+            out.update(self.alloc_tracer.stats())
+        return out
+
+    def _print_stats(self):
+        st = self._collect_stats()
+        spd = 'can.0x100'
+        print(f"STATS: frames={st['can.frames']:.0f} "
+              f"0x100 n={st.get(spd + '.count', 0):.0f} "
+              f"late={st.get(spd + '.late', 0):.0f} "
+              f"missed={st.get(spd + '.missed', 0):.0f} "
+              f"stalls={st.get(spd + '.stalls', 0):.0f} "
+              f"max_gap={st.get(spd + '.max_gap_ms', 0):.0f}ms | "
+              f"sock_drops={st['can.socket_drops']:.0f} "
+              f"iface_drops={st.get('can.iface.rx_dropped', 0):.0f} "
+              f"overruns={st.get('can.iface.rx_over_errors', 0):.0f}")
+        if 'battery.loop.ticks' in st:
+            print(f"STATS: battery loop period={st['battery.loop.period_ms']:.0f}ms "
+                  f"ticks={st['battery.loop.ticks']:.0f} "
+                  f"overruns={st['battery.loop.overruns']:.0f} "
+                  f"jitter avg={st['battery.loop.jitter_ms_avg']:.2f}ms "
+                  f"max={st['battery.loop.jitter_ms_max']:.2f}ms")
+        if self.gc_monitor is not None:
+            print(f"STATS: gc gen0/1/2={st['gc.gen0.collections']:.0f}/"
+                  f"{st['gc.gen1.collections']:.0f}/{st['gc.gen2.collections']:.0f} "
+                  f"pause avg={st['gc.pause_ms_avg']:.2f}ms max={st['gc.pause_ms_max']:.2f}ms | "
+                  f"on CAN thread n={st['gc.can_thread.pauses']:.0f} "
+                  f"max={st['gc.can_thread.pause_ms_max']:.2f}ms | frozen={st['gc.frozen']:.0f}")
+        if self.alloc_tracer is not None:
+            print(f"STATS: alloc/frame peak avg={st['alloc.frame_peak_bytes_avg']:.0f}B "
+                  f"max={st['alloc.frame_peak_bytes_max']:.0f}B "
+                  f"net={st['alloc.net_blocks_per_frame']:+.3f} blocks/frame "
+                  f"{' '.join(self.alloc_tracer.top)}")
+        return True
+
     # ---------- Battery ----------
-    def read_battery_percent(self):
-        if not self.ina219:
-            return 0.0
+    def _init_ina219(self):
         try:
-            bus_voltage = self.ina219.bus_voltage
-            percent = (bus_voltage - MIN_VOLTAGE) / (MAX_VOLTAGE - MIN_VOLTAGE) * 100.0
-            return max(0.0, min(percent, 100.0))
+            import board
+            import busio
+            from adafruit_ina219 import INA219
+            self._mark('import INA219 stack')
+            self.i2c_bus = busio.I2C(board.SCL, board.SDA)
+            self.ina219 = INA219(self.i2c_bus, 0x41)
+            print("✓ INA219 ready (0x41)")
         except Exception as e:
-            print(f"INA219 read error: {e}")
-            return 0.0
+            print(f"INA219 init failed: {e}")
+            self.ina219 = None
+        self._mark('INA219 ready')
 
-    def poll_battery(self):
-        while True:
-            batt = self.read_battery_percent()
-            if abs(self.battery_level - batt) > 0.1:
-                GLib.idle_add(self._emit_batt, batt)
-            time.sleep(1)
+    def _battery_worker(self):
+        """Battery thread: load the INA219 stack, then run the sampler loop here."""
+        try:
+            sampler = self._init_battery()
+        finally:
+            GLib.idle_add(self._loader_done, 'battery')
+        if sampler is not None:
+            sampler.run()
+
+    def _init_battery(self):
+        self._init_ina219()
+        if not self.ina219:
+            return None
+        from battery_soc import (BatterySampler, StableBatterySOC, HISTORY_SAMPLES,
+                                 ADC_AVERAGING, CAPACITY_MAH, MIN_PERIOD, MAX_PERIOD,
+                                 MAX_DT_PERIODS, load_curve)
+        try:
+            curve = load_curve(self.battery_curve)
+        except (OSError, ValueError) as e:
+            print(f"Battery curve {self.battery_curve!r} unusable ({e}); using built-in 3S 18650")
+            curve = load_curve(None)
+        soc = StableBatterySOC(history_samples=self.battery_history or HISTORY_SAMPLES,
+                               curve=curve)
+        sampler = BatterySampler(self.ina219, soc=soc, on_estimate=self._on_battery_estimate,
+                                 on_sample=self._on_battery_sample,
+                                 averaging=self.battery_averaging or ADC_AVERAGING,
+                                 capacity_mah=self.battery_capacity or CAPACITY_MAH,
+                                 min_period=self.battery_intervals[0] or MIN_PERIOD,
+                                 max_period=self.battery_intervals[1] or MAX_PERIOD)
+        self._apply_battery_restore(sampler)
+        # Same gap limit as the EKF: idle passes land slightly after max_period
+        self.trip.power_max_dt = MAX_DT_PERIODS * sampler.max_period
+        self.battery = sampler
+        return sampler
+
+    def _on_battery_estimate(self, est):
+        """Sampler thread: forward the smoothed SOC to the GLib thread."""
+        self._mark('first battery sample')
+        soc = est['soc_percent']
+        hist = self.history
+        if hist is not None:
+            hist.push('battery', time.monotonic(), soc)
+        if abs(self.battery_level - soc) > 0.1:
+            GLib.idle_add(self._emit_batt, soc)
+
+    def _on_battery_sample(self, ts, voltage, current, power):
+        """Sampler thread: every raw INA219 reading."""
+        self.trip.add_power(ts, power)
+        hist = self.history
+        if hist is not None:
+            hist.push('voltage', ts, voltage)
+            hist.push('current', ts, current)
+            hist.push('power', ts, power)
+
+    def _apply_battery_restore(self, sampler):
+        hist = self._battery_restore.pop(b'BHIS', b'')
+        for off in range(0, len(hist) - DOUBLE.size + 1, DOUBLE.size):
+            sampler.soc.voltage_history.push(DOUBLE.unpack_from(hist, off)[0])
+        ekf = self._battery_restore.pop(b'BEKF', b'')
+        if len(ekf) == BATTERY_EKF_STATE.size:
+            sampler.ekf.set_state(BATTERY_EKF_STATE.unpack(ekf))
+
+    def _pack_battery_ekf(self):
+        if self.battery is None:
+            return b''
+        return BATTERY_EKF_STATE.pack(*self.battery.ekf.get_state())
+
+    def _pack_battery_history(self):
+        if self.battery is None:
+            return b''
+        # Newest samples that fit one section (a long --battery-history would not)
+        hist = self.battery.soc.voltage_history.values()[-(SNAPSHOT_SEC_MAX // DOUBLE.size):]
+        return struct.pack(f'<{len(hist)}d', *hist)
+
+    # ---------- Sample history ----------
+    def _init_history(self):
+        """Loader thread: numpy takes seconds to import cold; samples before that are not kept."""
+        try:
+            from sample_history import SampleHistory
+            self.history = SampleHistory(self.history_seconds)
+            self._mark('history ready')
+        except ImportError as e:
+            print(f"Sample history disabled: {e}")
+        finally:
+            GLib.idle_add(self._loader_done, 'history')
+
+    # ---------- Sampling profiler ----------
+    def _start_profiler(self, rate_hz):
+        if self.profiler is not None and self.profiler.running:
+            return
+        from sampling_profiler import SamplingProfiler
+        self.profiler = SamplingProfiler(rate_hz).start()
+        print(f"[Dash] Profiler started ({self.profiler.rate_hz:.0f} Hz)")
+
+    def _stop_profiler(self):
+        prof = self.profiler
+        if prof is None or not prof.running:
+            return ''
+        prof.stop()
+        path = os.path.join(self.profile_dir,
+                            time.strftime('piracer_profile_%Y%m%d-%H%M%S.folded'))
+        try:
+            prof.write(path)
+        except OSError as e:
+            raise dbus.DBusException(f'Profile write failed: {e}')
+        st = prof.stats()
+        print(f"[Dash] Profiler stopped: {st['profiler.samples']:.0f} samples, "
+              f"{st['profiler.sample_us_avg']:.0f} us/sample "
+              f"({st['profiler.overhead_pct']:.2f}% CPU) -> {path}")
+        return path
+
+    def _toggle_profiler(self):
+        """SIGUSR1 (dispatched on the GLib thread): start, or stop and write."""
+        if self.profiler is not None and self.profiler.running:
+            try:
+                self._stop_profiler()
+            except dbus.DBusException as e:
+                print(e)
+        else:
+            self._start_profiler(self.profile_rate)
+        return True
 
     # ---------- CAN handling ----------
     def read_can_data(self):
-        print("Listening: CAN 0x100 (speed), 0x102 (gear)")
+        print("Listening: CAN 0x100 (speed), 0x101 (encoder interval), 0x102 (gear)")
+        if self.can_policy:
+            self.can_policy.apply('CAN thread')
+        if self.gc_monitor is not None:
+            self.gc_monitor.watch_ident = threading.get_ident()
+        recv = self._recv_raw if self._can_sock is not None else self.can_bus.recv
+        stats = self.can_stats
+        alloc = self.alloc_tracer
         while True:
             try:
-                message = self.can_bus.recv(timeout=1.0)
+                message = recv(timeout=1.0)
                 now = time.monotonic()
-                if message:
-                    self.process_can_message(message, now)
+                if message is None:
+                    stats.rx_idle += 1
+                elif message.is_error_frame:
+                    stats.error_frames += 1
+                else:
+                    # Gaps from the kernel receive time: frames that queued up
+                    # behind a slow reader still show their true spacing
+                    stats.on_frame(message.arbitration_id, message.timestamp)
+                    if alloc is None:
+                        self.process_can_message(message, now)
+                    else:
+                        alloc.frame_start()
+                        self.process_can_message(message, now)
+                        alloc.frame_end()
             except Exception as e:
                 print(f"CAN read error: {e}")
                 time.sleep(1)
 
+    def _update_speed(self, meas_cms, now_ts, rx_ts, dt=None, r_scale=None):
+        """now_ts: monotonic (watchdog, trip, history); rx_ts: kernel receive time (dt)."""
+        last_ts = self._last_speed_ts
+        last_rx = self._last_speed_rx
+        stale = False
+        if last_ts is not None and now_ts - last_ts > self.stale_timeout:
+            # Sender was silent (watchdog zeroed the gauge): start over
+            stale = True
+        self._last_speed_ts = now_ts
+        self._last_speed_rx = rx_ts
+        if dt is None and not stale and last_rx is not None and rx_ts > last_rx:
+            dt = rx_ts - last_rx
+
+        # Filter under the lock so a D-Bus swap/retune lands between frames
+        with self._filt_lock:
+            filt = self._speed_filt
+            if stale:
+                filt.reset()
+            t0 = time.perf_counter_ns()
+            filt_cms = filt.update(meas_cms, dt=dt, r_scale=r_scale)
+            ns = time.perf_counter_ns() - t0
+            self._filt_updates += 1
+            self._filt_ns_sum += ns
+            self._filt_ns_last = ns
+            if ns > self._filt_ns_max:
+                self._filt_ns_max = ns
+        self.trip.add_speed(now_ts, filt_cms)
+        hist = self.history
+        if hist is not None:
+            hist.push('speed', now_ts, filt_cms)
+
+        if self.debug:
+            print(f"Raw={meas_cms:5.1f}  Filt={filt_cms:5.1f}  Out={filt_cms:5.1f}")
+
+        if abs(self.current_speed - filt_cms) > 0.1:
+            GLib.idle_add(self._emit_speed, float(filt_cms))
+
     def process_can_message(self, message, now_ts):
         try:
             msg_id = message.arbitration_id
             data = message.data
 
-            if msg_id == 0x100 and len(data) >= 2:
+            if msg_id == 0x101 and len(data) >= 6:
+                # Encoder interval: uint16 pulses, uint32 window (us), big-endian
+                pulses = (data[0] << 8) | data[1]
+                window_us = (data[2] << 24) | (data[3] << 16) | (data[4] << 8) | data[5]
+                if window_us == 0:
+                    return
+                window = window_us * 1e-6
+                meas_cms = min(pulses * CM_PER_PULSE / window, MAX_SPEED_CMS)
+                self._last_interval_ts = now_ts
+                self._update_speed(meas_cms, now_ts, message.timestamp, dt=window,
+                                   r_scale=interval_var_scale(pulses, window))
+
+            elif msg_id == 0x100 and len(data) >= 2:
+                # Fallback for senders without 0x101
+                last_iv = self._last_interval_ts
+                if last_iv is not None and now_ts - last_iv < INTERVAL_PREFER_S:
+                    return
                 speed_raw = (data[0] << 8) | data[1]   # big-endian
                 meas_cms = float(speed_raw)            # Arduino sends cm/s directly
-
-                dt = None
-                if self._last_speed_ts is not None:
-                    dt = now_ts - self._last_speed_ts
-                self._last_speed_ts = now_ts
-
-                # Apply Kalman filtering
-                filt_cms = self._speed_filt.update(meas_cms, dt=dt)
-                
-                # Simple timeout-based zero forcing (no complex hysteresis)
-                if (now_ts - self._last_speed_ts if self._last_speed_ts else 0) > 0.5:
-                    filt_cms = 0.0
-
-                if self.debug:
-                    print(f"Raw={meas_cms:5.1f}  Filt={filt_cms:5.1f}  Out={filt_cms:5.1f}")
-
-                if abs(self.current_speed - filt_cms) > 0.1:
-                    GLib.idle_add(self._emit_speed, float(filt_cms))
+                self._update_speed(meas_cms, now_ts, message.timestamp)
 
             elif msg_id == 0x102 and len(data) >= 1:
                 gear_char = chr(data[0]) if data[0] != 0 else 'P'
@@ -288,12 +1288,99 @@ if __name__ == '__main__':
                         help='CAN interface (can0, can1, or auto)')
     parser.add_argument('--debug', action='store_true',
                         help='Print raw + filtered + output speeds')
+    parser.add_argument('--stats', action='store_true',
+                        help=f'Print CAN drop/gap statistics every {STATS_PERIOD} s')
+    parser.add_argument('--stale-timeout', type=float, default=STALE_TIMEOUT,
+                        help='Seconds without a speed frame before the gauge is pulled to zero')
+    parser.add_argument('--stale-mode', choices=('decay', 'zero'), default=STALE_MODE,
+                        help='Decay speed toward zero or force it to zero when stale')
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH,
+                        help='Warm-restart state file (empty string disables)')
+    parser.add_argument('--snapshot-max-age', type=float, default=SNAPSHOT_MAX_AGE,
+                        help='Ignore snapshots older than this many seconds')
+    parser.add_argument('--trip-file', default=TRIP_PATH,
+                        help='Persistent trip computer state (empty string disables)')
+    parser.add_argument('--startup-timing', action='store_true',
+                        help='Print a per-phase startup timing breakdown')
+    parser.add_argument('--battery-history', type=int, default=None,
+                        help='Battery estimates kept for trend/stability (default 10, cost is O(1) per sample)')
+    parser.add_argument('--battery-curve', default=None,
+                        help='Pack SOC curve: file path or name in battery_curves/ (default: built-in 3S 18650)')
+    parser.add_argument('--battery-averaging', type=int, default=None,
+                        choices=(1, 2, 4, 8, 16, 32, 64, 128),
+                        help='INA219 on-chip samples per conversion (default 128)')
+    parser.add_argument('--battery-capacity', type=float, default=None,
+                        help='Pack capacity in mAh for coulomb counting (default 2600)')
+    parser.add_argument('--battery-min-interval', type=float, default=None,
+                        help='Fastest INA219 polling interval under load, s (default 0.15)')
+    parser.add_argument('--battery-max-interval', type=float, default=None,
+                        help='Slowest INA219 polling interval when idle, s (default 5.0)')
+    parser.add_argument('--filter', dest='filter_engine', choices=tuple(FILTER_ENGINES),
+                        default=FILTER_ENGINE,
+                        help='Speed filter at startup (switchable later via SetFilterEngine)')
+    parser.add_argument('--history-seconds', type=float, default=HISTORY_SECONDS,
+                        help='Seconds of samples kept for GetHistory (0 disables, needs numpy)')
+    rt_sched.add_arguments(parser, 'can', what='CAN receive thread')
+    parser.add_argument('--gc-stats', action='store_true',
+                        help='Time GC pauses (gc.callbacks) and report them in GetStats/--stats')
+    parser.add_argument('--alloc-trace', action='store_true',
+                        help='tracemalloc per-frame allocations on the CAN thread (slow; diagnostics only)')
+    parser.add_argument('--gc-freeze', action='store_true',
+                        help='gc.freeze() everything allocated during startup (once the INA219 and '
+                             'history loaders are done) so collections skip it')
+    parser.add_argument('--gc-threshold', default=None,
+                        help='gc.set_threshold values, e.g. 2000,20,20 (default: Python\'s 700,10,10)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Start the sampling profiler at launch (stop with SIGUSR1 or StopProfiler)')
+    parser.add_argument('--profile-rate', type=float, default=PROFILE_RATE_HZ,
+                        help='Profiler stack samples per second')
+    parser.add_argument('--profile-dir', default=PROFILE_DIR,
+                        help='Directory for collapsed-stack (.folded) profile files')
     args = parser.parse_args()
+    if args.gc_threshold:
+        from gc_monitor import parse_gc_threshold
+        try:
+            args.gc_threshold = parse_gc_threshold(args.gc_threshold)
+        except ValueError as e:
+            parser.error(f"--gc-threshold: {e}")
+    threading.current_thread().name = 'glib'   # label for profiles
 
     try:
-        service = CompleteDashboardService(can_iface=args.can_iface, debug=args.debug)
+        service = CompleteDashboardService(can_iface=args.can_iface, debug=args.debug,
+                                           stats=args.stats,
+                                           stale_timeout=args.stale_timeout,
+                                           stale_mode=args.stale_mode,
+                                           snapshot_path=args.snapshot,
+                                           snapshot_max_age=args.snapshot_max_age,
+                                           trip_path=args.trip_file,
+                                           startup_timing=args.startup_timing,
+                                           battery_history=args.battery_history,
+                                           battery_curve=args.battery_curve,
+                                           battery_averaging=args.battery_averaging,
+                                           battery_capacity=args.battery_capacity,
+                                           battery_min_interval=args.battery_min_interval,
+                                           battery_max_interval=args.battery_max_interval,
+                                           history_seconds=args.history_seconds,
+                                           filter_engine=args.filter_engine,
+                                           can_policy=rt_sched.ThreadPolicy.from_args(args, 'can'),
+                                           profile_rate=args.profile_rate,
+                                           profile_dir=args.profile_dir,
+                                           gc_stats=args.gc_stats,
+                                           alloc_trace=args.alloc_trace,
+                                           gc_freeze=args.gc_freeze)
+        if args.gc_threshold:
+            gc.set_threshold(*args.gc_threshold)
         if service.connected:
-            GLib.MainLoop().run()
+            if args.profile:
+                service._start_profiler(args.profile_rate)
+            service.mainloop = GLib.MainLoop()
+            try:
+                service.mainloop.run()
+            finally:
+                service._save_snapshot()
+                service._save_trip()
+                if service.profiler is not None and service.profiler.running:
+                    service._toggle_profiler()   # keep a --profile run's output
         else:
             print("Cannot start - CAN connection failed")
     except KeyboardInterrupt:
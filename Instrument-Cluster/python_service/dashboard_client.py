@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Python client for the com.piracer.dashboard D-Bus service:
+- DashboardClient: local mirror of speed/battery/gear/turn signal, seeded
+  once with Get* calls and then kept current by signals; reads never
+  touch the bus and never block (each field is one immutable (value, ts)
+  tuple, replaced whole)
+- Change callbacks and per-field staleness timestamps
+- Re-seeds automatically when the service (re)appears on the bus
+- AsyncDashboardCalls: non-blocking, coalescing method calls
+- Fan-out benchmark: python3 dashboard_client.py --bench 0,1,4,16
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import dbus
+import dbus.mainloop.glib
+from gi.repository import GLib
+
+BUS_NAME   = 'com.piracer.dashboard'
+OBJ_PATH   = '/com/piracer/dashboard'
+IFACE_NAME = 'com.piracer.dashboard'
+
+DBUS_CALL_TIMEOUT = 0.3   # s per call; runs on the GLib thread, never in the caller
+
+# field -> (seed method, change signal, converter)
+FIELDS = {
+    'speed':       ('GetSpeed',        'SpeedChanged',      lambda v: max(0.0, float(v))),
+    'battery':     ('GetBatteryLevel', 'BatteryChanged',    lambda v: max(0.0, min(100.0, float(v)))),
+    'gear':        ('GetGear',         'GearChanged',       str),
+    'turn_signal': ('GetTurnSignal',   'TurnSignalChanged', str),
+}
+DEFAULTS = {'speed': 0.0, 'battery': 0.0, 'gear': 'P', 'turn_signal': 'off'}
+
+# ==================== Async calls ====================
+class AsyncDashboardCalls:
+    """
+    Non-blocking dashboard method calls for control loops. Calls are
+    issued on the GLib thread with reply/error handlers. At most one call
+    per method is in flight; a newer request replaces a queued one (only
+    the latest gear/turn mode matters), so the queue never grows past one
+    entry per method. Latency is measured from request to reply.
+    """
+    def __init__(self, proxy, timeout=DBUS_CALL_TIMEOUT):
+        self.proxy = proxy
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._queued = {}      # method -> (args, request time)
+        self._inflight = set()
+        self.sent = 0
+        self.ok = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.lat_last = 0.0
+        self.lat_max = 0.0
+        self._lat_sum = 0.0
+
+    def call(self, method, *args):
+        """Queue method(*args); returns immediately."""
+        with self._lock:
+            if method in self._queued:
+                self.coalesced += 1
+            self._queued[method] = (args, time.monotonic())
+            if method in self._inflight:
+                return          # sent from the reply handler of the current call
+            self._inflight.add(method)
+        GLib.idle_add(self._send, method)
+
+    def _send(self, method):
+        # GLib thread
+        with self._lock:
+            args, t_req = self._queued.pop(method)
+            self.sent += 1
+        try:
+            getattr(self.proxy, method)(
+                *args, timeout=self.timeout,
+                reply_handler=lambda *_: self._done(method, t_req, None),
+                error_handler=lambda e: self._done(method, t_req, e))
+        except Exception as e:   # e.g. not connected: fails before any reply
+            self._done(method, t_req, e)
+        return False
+
+    def _done(self, method, t_req, err):
+        lat = time.monotonic() - t_req
+        with self._lock:
+            if err is None:
+                self.ok += 1
+                self.lat_last = lat
+                self._lat_sum += lat
+                if lat > self.lat_max:
+                    self.lat_max = lat
+            else:
+                self.failed += 1
+            resend = method in self._queued
+            if not resend:
+                self._inflight.discard(method)
+                self._idle.notify_all()
+        if err is not None:
+            print(f"{method} failed after {lat * 1000:.0f} ms: {err}")
+        if resend:
+            self._send(method)
+
+    def flush(self, timeout):
+        """Block until every queued call has been answered (or timeout)."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._inflight, timeout)
+
+    def summary(self):
+        avg = self._lat_sum / self.ok if self.ok else 0.0
+        return (f"D-Bus calls: sent={self.sent} ok={self.ok} failed={self.failed} "
+                f"coalesced={self.coalesced} latency avg={avg * 1000:.1f}ms "
+                f"max={self.lat_max * 1000:.1f}ms")
+
+# ==================== Telemetry mirror ====================
+class DashboardClient:
+    """
+    Usage:
+        dash = DashboardClient()
+        dash.on_change('gear', lambda field, new, old: ...)
+        dash.speed, dash.age('speed'), dash.set_gear('D')
+
+    Callbacks run on the client's GLib thread; keep them short. Pass
+    `bus` (and start_loop=False) to share an existing connection and loop.
+    """
+    def __init__(self, bus=None, start_loop=True):
+        if bus is None:
+            dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+            bus = dbus.SessionBus()
+        self.bus = bus
+        obj = bus.get_object(BUS_NAME, OBJ_PATH, introspect=False, follow_name_owner_changes=True)
+        self.proxy = dbus.Interface(obj, IFACE_NAME)
+        self.calls = AsyncDashboardCalls(self.proxy)
+        # field -> (value, monotonic ts of last update or None); replaced, never mutated
+        self._fields = {name: (DEFAULTS[name], None) for name in FIELDS}
+        self._callbacks = {name: [] for name in FIELDS}
+        self._callbacks['*'] = []
+        self.updates = 0
+        self.service_online = False
+        self.seeded = threading.Event()
+        self._seed_ts = 0.0
+
+        for name, (_, signal, conv) in FIELDS.items():
+            bus.add_signal_receiver(self._make_handler(name, conv), signal_name=signal,
+                                    dbus_interface=IFACE_NAME, path=OBJ_PATH)
+        # Fires once right away with the current owner: that does the first seed
+        bus.watch_name_owner(BUS_NAME, self._on_owner)
+
+        self.loop = None
+        if start_loop:
+            self.loop = GLib.MainLoop()
+            threading.Thread(target=self.loop.run, name='dbus-client', daemon=True).start()
+
+    # ---------- Mirror reads (any thread, no bus traffic) ----------
+    def get(self, field):
+        return self._fields[field][0]
+
+    def age(self, field):
+        """Seconds since `field` last changed or was seeded; None if never."""
+        ts = self._fields[field][1]
+        return None if ts is None else time.monotonic() - ts
+
+    def is_stale(self, field, max_age):
+        age = self.age(field)
+        return age is None or age > max_age
+
+    def snapshot(self):
+        """{field: (value, ts)} at one instant."""
+        return dict(self._fields)
+
+    @property
+    def speed(self):
+        return self._fields['speed'][0]
+
+    @property
+    def battery(self):
+        return self._fields['battery'][0]
+
+    @property
+    def gear(self):
+        return self._fields['gear'][0]
+
+    @property
+    def turn_signal(self):
+        return self._fields['turn_signal'][0]
+
+    def on_change(self, field, callback):
+        """callback(field, new, old) whenever `field` changes value ('*' = any field)."""
+        self._callbacks[field].append(callback)
+
+    # ---------- Commands (non-blocking) ----------
+    def set_gear(self, gear):
+        self.calls.call('SetGear', gear)
+
+    def set_turn_signal(self, mode):
+        self.calls.call('SetTurnSignal', mode)
+
+    # ---------- GLib thread ----------
+    def _make_handler(self, name, conv):
+        return lambda value: self._update(name, conv(value), seed=False)
+
+    def _update(self, name, value, seed):
+        old, ts = self._fields[name]
+        if seed and ts is not None and ts > self._seed_ts:
+            return          # a signal beat the seed reply; it is newer
+        self._fields[name] = (value, time.monotonic())
+        self.updates += 1
+        if value != old:
+            for cb in self._callbacks[name] + self._callbacks['*']:
+                try:
+                    cb(name, value, old)
+                except Exception as e:
+                    print(f"Dashboard callback for {name} failed: {e}")
+
+    def _on_owner(self, owner):
+        self.service_online = bool(owner)
+        if owner:
+            self._seed()
+
+    def _seed(self):
+        self._seed_ts = time.monotonic()
+        pending = set(FIELDS)
+
+        def done(name):
+            pending.discard(name)
+            if not pending:
+                self.seeded.set()
+
+        for name, (method, _, conv) in FIELDS.items():
+            def reply(value, name=name, conv=conv):
+                self._update(name, conv(value), seed=True)
+                done(name)
+
+            def error(e, name=name):
+                print(f"Dashboard seed {name} failed: {e}")
+                done(name)
+
+            getattr(self.proxy, method)(timeout=DBUS_CALL_TIMEOUT * 10,
+                                        reply_handler=reply, error_handler=error)
+
+# ==================== Fan-out benchmark ====================
+def _cpu_seconds(pid):
+    """utime + stime of a process from /proc, in s."""
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+def _owner_pid(bus, name):
+    return int(bus.call_blocking('org.freedesktop.DBus', '/org/freedesktop/DBus',
+                                 'org.freedesktop.DBus', 'GetConnectionUnixProcessID',
+                                 's', (name,)))
+
+def _bus_daemon_pid(bus):
+    try:
+        return _owner_pid(bus, 'org.freedesktop.DBus')
+    except dbus.DBusException:
+        pass
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f'/proc/{pid}/comm') as f:
+                if f.read().strip() in ('dbus-daemon', 'dbus-broker'):
+                    return int(pid)
+        except OSError:
+            continue
+    return None
+
+def _subscriber(ready, stop, results):
+    dash = DashboardClient()
+    dash.seeded.wait(5.0)
+    ready.set()
+    stop.wait()
+    results.put(dash.updates)
+
+def bench(counts, seconds):
+    import multiprocessing
+    ctx = multiprocessing.get_context('spawn')   # fresh bus connection per subscriber
+    dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
+    bus = dbus.SessionBus()
+    service_pid = _owner_pid(bus, BUS_NAME)
+    daemon_pid = _bus_daemon_pid(bus)
+    print(f"service pid={service_pid} bus daemon pid={daemon_pid}  {seconds:.0f}s per step")
+    print("Needs live speed traffic (drive, or e.g. `cangen can0 -I 101 -L 6 -g 50`)")
+    print(f"{'subs':>5} {'service CPU%':>13} {'bus CPU%':>9} {'updates/s/sub':>14}")
+    for n in counts:
+        stop = ctx.Event()
+        results = ctx.Queue()
+        readies = [ctx.Event() for _ in range(n)]
+        procs = [ctx.Process(target=_subscriber, args=(r, stop, results), daemon=True)
+                 for r in readies]
+        for p in procs:
+            p.start()
+        for r in readies:
+            r.wait(10.0)
+        s0 = _cpu_seconds(service_pid)
+        d0 = _cpu_seconds(daemon_pid) if daemon_pid else 0.0
+        t0 = time.monotonic()
+        time.sleep(seconds)
+        wall = time.monotonic() - t0
+        s1 = _cpu_seconds(service_pid)
+        d1 = _cpu_seconds(daemon_pid) if daemon_pid else 0.0
+        stop.set()
+        updates = [results.get(timeout=5.0) for _ in procs]
+        for p in procs:
+            p.join(2.0)
+        per_sub = sum(updates) / len(updates) / wall if updates else 0.0
+        print(f"{n:5d} {(s1 - s0) / wall * 100:13.2f} "
+              f"{(d1 - d0) / wall * 100 if daemon_pid else float('nan'):9.2f} {per_sub:14.1f}")
+
+def main():
+    ap = argparse.ArgumentParser(description='Dashboard telemetry mirror / fan-out benchmark')
+    ap.add_argument('--bench', default=None,
+                    help='Comma-separated subscriber counts, e.g. 0,1,4,16')
+    ap.add_argument('--seconds', type=float, default=10.0, help='Measurement time per step')
+    args = ap.parse_args()
+    if args.bench:
+        bench([int(x) for x in args.bench.split(',')], args.seconds)
+        return
+    dash = DashboardClient()
+    dash.on_change('*', lambda field, new, old: print(f"{field}: {old} -> {new}"))
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    sys.exit(main())
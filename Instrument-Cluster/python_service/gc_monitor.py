@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+GC and allocation instrumentation for the dashboard service (diagnostics):
+- GcMonitor: times every collection through gc.callbacks and counts the
+  pauses that landed on a watched thread (the CAN receive thread)
+- AllocTracer: tracemalloc around each unit of work (a CAN frame): bytes
+  allocated per frame and the sites that keep blocks alive
+- parse_gc_threshold for --gc-threshold
+
+Imported only under --gc-stats/--alloc-trace/--gc-threshold.
+"""
+
+import gc
+import time
+import threading
+
+ALLOC_WINDOW = 1000      # frames between tracemalloc snapshot comparisons
+ALLOC_TOP = 3            # allocation sites kept from each comparison
+
+# ==================== GC pauses ====================
+class GcMonitor:
+    """
+    Times every collection through gc.callbacks and notes which ones ran
+    on the watched (CAN) thread, i.e. stalled the gauge feed.
+    """
+    def __init__(self):
+        self.watch_ident = None
+        self.collections = [0, 0, 0]
+        self.collected = 0
+        self.pauses = 0
+        self.pause_sum = 0.0
+        self.pause_max = 0.0
+        self.watched_pauses = 0
+        self.watched_pause_max = 0.0
+        self._t0 = None
+
+    def install(self):
+        gc.callbacks.append(self._callback)
+        return self
+
+    def _callback(self, phase, info):
+        if phase == 'start':
+            self._t0 = time.perf_counter()
+            return
+        if self._t0 is None:
+            return
+        dt = time.perf_counter() - self._t0
+        self._t0 = None
+        self.collections[info['generation']] += 1
+        self.collected += info['collected']
+        self.pauses += 1
+        self.pause_sum += dt
+        if dt > self.pause_max:
+            self.pause_max = dt
+        if threading.get_ident() == self.watch_ident:
+            self.watched_pauses += 1
+            if dt > self.watched_pause_max:
+                self.watched_pause_max = dt
+
+    def stats(self):
+        n = self.pauses
+        out = {f'gc.gen{g}.collections': float(c) for g, c in enumerate(self.collections)}
+        out.update({
+            'gc.collected': float(self.collected),
+            'gc.pause_ms_avg': self.pause_sum / n * 1e3 if n else 0.0,
+            'gc.pause_ms_max': self.pause_max * 1e3,
+            'gc.pause_ms_total': self.pause_sum * 1e3,
+            'gc.can_thread.pauses': float(self.watched_pauses),
+            'gc.can_thread.pause_ms_max': self.watched_pause_max * 1e3,
+            'gc.frozen': float(gc.get_freeze_count()),
+        })
+        for g, th in enumerate(gc.get_threshold()):
+            out[f'gc.threshold{g}'] = float(th)
+        return out
+
+# ==================== Allocation tracing ====================
+class AllocTracer:
+    """
+    tracemalloc around each CAN frame: the traced peak above the pre-frame
+    level gives the bytes allocated while the frame was processed
+    (transient included). tracemalloc is process-wide, so that peak also
+    counts whatever the battery and GLib threads allocated meanwhile; read
+    it as an upper bound. Snapshot diffs every ALLOC_WINDOW frames are
+    limited to `paths` (filename patterns of the traced code path) and
+    give the blocks left behind and where. Tracing slows every allocation in
+    the process, so this is a diagnostic mode, not for normal drives.
+    """
+    def __init__(self, paths, window=ALLOC_WINDOW):
+        import tracemalloc
+        self._tm = tracemalloc
+        self.window = window
+        self.frames = 0
+        self.peak_sum = 0
+        self.peak_max = 0
+        self.net_blocks_per_frame = 0.0
+        self.top = []             # 'file:line +N blocks' from the last window
+        self._base = 0
+        self._snap = None
+        self._filters = tuple(tracemalloc.Filter(True, p) for p in paths)
+        tracemalloc.start()
+
+    def frame_start(self):
+        tm = self._tm
+        tm.reset_peak()
+        self._base = tm.get_traced_memory()[0]
+
+    def frame_end(self):
+        tm = self._tm
+        peak = tm.get_traced_memory()[1] - self._base
+        self.frames += 1
+        self.peak_sum += peak
+        if peak > self.peak_max:
+            self.peak_max = peak
+        if self.frames % self.window == 0:
+            self._compare()
+
+    def _compare(self):
+        snap = self._tm.take_snapshot().filter_traces(self._filters)
+        if self._snap is not None:
+            diff = snap.compare_to(self._snap, 'lineno')
+            self.net_blocks_per_frame = sum(d.count_diff for d in diff) / self.window
+            self.top = [f"{d.traceback[0].filename.rsplit('/', 1)[-1]}:{d.traceback[0].lineno} "
+                        f"{d.count_diff:+d} blocks" for d in diff[:ALLOC_TOP] if d.count_diff]
+        self._snap = snap
+
+    def stats(self):
+        n = self.frames
+        return {
+            'alloc.frames': float(n),
+            'alloc.frame_peak_bytes_avg': self.peak_sum / n if n else 0.0,
+            'alloc.frame_peak_bytes_max': float(self.peak_max),
+            'alloc.net_blocks_per_frame': self.net_blocks_per_frame,
+            'alloc.traced_kb': self._tm.get_traced_memory()[0] / 1024.0,
+        }
+
+# ==================== Helpers ====================
+def parse_gc_threshold(text):
+    """'700,10,10' -> (700, 10, 10); one to three non-negative ints."""
+    vals = tuple(int(x) for x in text.split(','))
+    if not 1 <= len(vals) <= 3 or min(vals) < 0:
+        raise ValueError('expected 1-3 comma-separated non-negative ints')
+    return vals
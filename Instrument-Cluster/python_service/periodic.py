@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Fixed-rate loop scheduler shared by rc_piracer.py and the dashboard service:
+- Absolute monotonic deadlines (tick k is due at start + k*period), so
+  body time and sleep overshoot never accumulate as drift
+- Overrun policy: 'skip' drops missed ticks and realigns to the grid,
+  'catchup' runs them back to back (bounded by max_catchup)
+- Per-loop jitter (wake-up lateness) and overrun/skip counters
+- Pluggable wait hook, e.g. an input-event wait instead of time.sleep
+"""
+
+import time
+
+SKIP = 'skip'
+CATCHUP = 'catchup'
+MAX_CATCHUP = 5   # ticks a 'catchup' loop may run late before it realigns
+
+class Periodic:
+    """
+    Usage:
+        loop = Periodic(0.05)
+        while True:
+            loop.tick()      # returns at each deadline
+            body()
+
+    `wait(timeout_s)` may return early (e.g. an event arrived); tick()
+    keeps waiting until the deadline, unless wait returns True
+    (threading.Event.wait semantics): then tick() returns None at once.
+    `period` may be changed between ticks; the next deadline is the
+    previous one plus the new period.
+    """
+    def __init__(self, period, policy=SKIP, wait=time.sleep, clock=time.monotonic,
+                 max_catchup=MAX_CATCHUP):
+        if policy not in (SKIP, CATCHUP):
+            raise ValueError(f"unknown policy {policy!r} (use {SKIP}/{CATCHUP})")
+        self.period = period
+        self.policy = policy
+        self.wait = wait
+        self.clock = clock
+        self.max_catchup = max_catchup
+        self._deadline = None
+        self.reset_stats()
+
+    def reset(self):
+        """Forget the grid; the next tick() returns at once and restarts it."""
+        self._deadline = None
+
+    def reset_stats(self):
+        self.ticks = 0
+        self.overruns = 0      # body + wait exceeded a period
+        self.skipped = 0       # ticks dropped to realign
+        self.late_last = 0.0
+        self.late_max = 0.0
+        self._late_sum = 0.0
+
+    def tick(self):
+        """Block until the next deadline; returns how late (s) this wake-up is (None if interrupted)."""
+        now = self.clock()
+        if self._deadline is None:
+            self._deadline = now
+            self.ticks += 1
+            return 0.0
+        period = self.period
+        deadline = self._deadline + period
+        if now > deadline + period:
+            # Missed at least one whole tick
+            self.overruns += 1
+            missed = int((now - deadline) // period)
+            if self.policy == SKIP or missed > self.max_catchup:
+                self.skipped += missed
+                deadline += missed * period   # latest grid slot <= now
+        elif now > deadline:
+            self.overruns += 1
+        while now < deadline:
+            if self.wait(deadline - now) is True:
+                return None
+            now = self.clock()
+        self._deadline = deadline
+
+        late = now - deadline
+        self.ticks += 1
+        self.late_last = late
+        self._late_sum += late
+        if late > self.late_max:
+            self.late_max = late
+        return late
+
+    def stats(self, prefix='loop'):
+        n = self.ticks
+        return {
+            f'{prefix}.period_ms': self.period * 1e3,
+            f'{prefix}.ticks': float(n),
+            f'{prefix}.overruns': float(self.overruns),
+            f'{prefix}.skipped': float(self.skipped),
+            f'{prefix}.jitter_ms_last': self.late_last * 1e3,
+            f'{prefix}.jitter_ms_avg': self._late_sum / n * 1e3 if n else 0.0,
+            f'{prefix}.jitter_ms_max': self.late_max * 1e3,
+        }
+
+    def summary(self):
+        n = self.ticks
+        avg = self._late_sum / n * 1e3 if n else 0.0
+        return (f"ticks={n} overruns={self.overruns} skipped={self.skipped} "
+                f"jitter avg={avg:.2f}ms max={self.late_max * 1e3:.2f}ms "
+                f"@ {self.period * 1e3:.0f}ms")
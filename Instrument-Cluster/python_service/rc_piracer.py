@@ -1,17 +1,22 @@
 #!/usr/bin/env python3
 import time
+import argparse
 import pygame
-import dbus
-import dbus.mainloop.glib
-from gi.repository import GLib
 from piracer.vehicles import PiRacerStandard
-
-BUS_NAME   = 'com.piracer.dashboard'
-OBJ_PATH   = '/com/piracer/dashboard'
-IFACE_NAME = 'com.piracer.dashboard'
+from dashboard_client import DashboardClient
+from periodic import Periodic
+import rt_sched
 
 LB_BTN = 4
 RB_BTN = 5
+STEER_AXIS = 0
+THROTTLE_AXIS = 4
+
+CONTROL_PERIOD = 0.05      # s; fixed-rate housekeeping tick, input is handled as it arrives
+JOY_EVENTS = (pygame.JOYAXISMOTION, pygame.JOYHATMOTION,
+              pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP)
+
+SHUTDOWN_FLUSH = 0.5      # s to wait for the final turn-signal call on exit
 
 class RCExample:
     def __init__(self):
@@ -20,89 +25,100 @@ class RCExample:
         if pygame.joystick.get_count() == 0:
             raise Exception("No gamepad detected")
         self.pad = pygame.joystick.Joystick(0); self.pad.init()
+        # Wake only for gamepad input; everything else stays out of the queue
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed(list(JOY_EVENTS) + [pygame.QUIT])
         self.prev_buttons = {}
+        self._chord = False         # both bumpers went down: ignore their releases
+        self.steering = -self.pad.get_axis(STEER_AXIS)
+        self.raw_throttle = abs(self.pad.get_axis(THROTTLE_AXIS))
+        # Input-to-actuator latency (event dequeued -> PiRacer writes done)
+        self.lat_n = 0
+        self.lat_sum = 0.0
+        self.lat_max = 0.0
         self.turn_mode = "off"
         self.current_gear = 'P'
         
-        # FIXED: Remove double smoothing - use raw values directly
-        self.current_speed = 0.0    # Direct from D-Bus (Kalman filtered)
-        self.current_batt = 0.0     # Direct from D-Bus
-        
         # Throttle limiting
         self.max_throttle = 0.6    # 60% throttle limit
         
         self._last_print = 0
-        self.dashboard = None
-        self.dbus_loop = None
+        self.throttle = 0.0
+        self.dash = None
         self.setup_dbus()
 
     def setup_dbus(self):
-        dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
-        bus = dbus.SessionBus()
-        obj = bus.get_object(BUS_NAME, OBJ_PATH, introspect=False)
-        self.dashboard = dbus.Interface(obj, IFACE_NAME)
-        
-        # Subscribe to asynchronous updates
-        bus.add_signal_receiver(self.on_speed,   dbus_interface=IFACE_NAME, signal_name='SpeedChanged')
-        bus.add_signal_receiver(self.on_battery, dbus_interface=IFACE_NAME, signal_name='BatteryChanged')
-        bus.add_signal_receiver(self.on_gear,    dbus_interface=IFACE_NAME, signal_name='GearChanged')
-        
-        # Spin a loop so signals are processed
-        self.dbus_loop = GLib.MainLoop()
-        import threading
-        threading.Thread(target=self.dbus_loop.run, daemon=True).start()
-
-    # --- Signal handlers (FIXED: No smoothing) ---
-    def on_speed(self, v):
-        # REMOVED: alpha smoothing - use Kalman filtered value directly
-        self.current_speed = max(0.0, float(v))
-        
-    def on_battery(self, p): 
-        self.current_batt = max(0.0, min(100.0, float(p)))
-        
-    def on_gear(self, g):    
-        self.current_gear = str(g)
+        # Speed/battery are read from the client's mirror (Kalman filtered by the
+        # service, no extra smoothing); only gear changes need a callback
+        self.dash = DashboardClient()
+        self.dash.on_change('gear', self.on_gear)
+
+    def on_gear(self, field, g, old):
+        self.current_gear = g
 
     # --- Input helpers ---
-    def read_axes(self):
-        pygame.event.pump()
-        steering = -self.pad.get_axis(0)
-        throttle = abs(self.pad.get_axis(4))
-        hat = self.pad.get_hat(0)
-        gear = None
-        if   hat[1] ==  1: gear = 'D'
-        elif hat[1] == -1: gear = 'R'
-        elif hat[0] == -1: gear = 'P'
-        elif hat[0] ==  1: gear = 'N'
-        return steering, throttle, gear
+    @staticmethod
+    def hat_to_gear(hat):
+        if   hat[1] ==  1: return 'D'
+        elif hat[1] == -1: return 'R'
+        elif hat[0] == -1: return 'P'
+        elif hat[0] ==  1: return 'N'
+        return None
 
-    def read_button_edges(self):
+    def read_events(self, timeout_ms):
+        """
+        Block until gamepad input arrives (or timeout), then drain the queue
+        so a burst of axis events costs one actuator update. Returns
+        (axes_changed, gear or None, button edges, dequeue time).
+        """
+        ev = pygame.event.wait(timeout_ms)
+        t_in = time.perf_counter()
+        axes = False
+        gear = None
         edges = {}
-        for i in range(self.pad.get_numbuttons()):
-            cur = self.pad.get_button(i) == 1
-            prev = self.prev_buttons.get(i, False)
-            if cur != prev:
-                edges[i] = "down" if cur else "up"
-            self.prev_buttons[i] = cur
-        return edges
+        for ev in [ev] + pygame.event.get():
+            if ev.type == pygame.JOYAXISMOTION:
+                if ev.axis == STEER_AXIS:
+                    self.steering = -ev.value
+                    axes = True
+                elif ev.axis == THROTTLE_AXIS:
+                    self.raw_throttle = abs(ev.value)
+                    axes = True
+            elif ev.type == pygame.JOYHATMOTION and ev.hat == 0:
+                gear = self.hat_to_gear(ev.value) or gear
+            elif ev.type == pygame.JOYBUTTONDOWN:
+                edges[ev.button] = "down"
+                self.prev_buttons[ev.button] = True
+            elif ev.type == pygame.JOYBUTTONUP:
+                edges[ev.button] = "up"
+                self.prev_buttons[ev.button] = False
+            elif ev.type == pygame.QUIT:
+                raise KeyboardInterrupt
+        return axes, gear, edges, t_in
 
     def set_turn_signal(self, mode):
         if mode == self.turn_mode: return
         self.turn_mode = mode
-        try:
-            self.dashboard.SetTurnSignal(mode, timeout=0.3)
-        except Exception as e:
-            print(f"SetTurnSignal failed: {e}")
+        self.dash.set_turn_signal(mode)
 
     def update_turn_from_buttons(self, edges):
         lb_down = edges.get(LB_BTN) == "down"
         rb_down = edges.get(RB_BTN) == "down"
         lb_up   = edges.get(LB_BTN) == "up"
         rb_up   = edges.get(RB_BTN) == "up"
-        
-        if lb_down and rb_down:
+        lb_held = self.prev_buttons.get(LB_BTN, False)
+        rb_held = self.prev_buttons.get(RB_BTN, False)
+
+        # Events arrive one press at a time: a chord is one bumper going
+        # down while the other is held
+        if (lb_down or rb_down) and lb_held and rb_held:
+            self._chord = True
             self.set_turn_signal("hazard")
             return
+        if self._chord:
+            if not lb_held and not rb_held:
+                self._chord = False
+            return
         if lb_up:
             self.set_turn_signal("off" if self.turn_mode == "left" else "left")
         if rb_up:
@@ -121,41 +137,65 @@ class RCExample:
             return limited_throttle if limited_throttle > 0.05 else 0.0
         return 0.0
 
+    def apply_controls(self, t_in):
+        throttle = self.apply_gear_logic(self.raw_throttle)
+        self.piracer.set_steering_percent(self.steering)
+        self.piracer.set_throttle_percent(throttle)
+        lat = time.perf_counter() - t_in
+        self.lat_n += 1
+        self.lat_sum += lat
+        if lat > self.lat_max:
+            self.lat_max = lat
+        return throttle
+
+    def handle_input(self, timeout):
+        """Periodic wait hook: handle gamepad events until the next tick is due."""
+        axes, gear, edges, t_in = self.read_events(max(1, int(timeout * 1000)))
+        
+        # On gear change, tell the dashboard service
+        if gear and gear != self.current_gear:
+            self.current_gear = gear
+            self.piracer.set_throttle_percent(0.0)  # jerk guard
+            self.dash.set_gear(gear)
+            axes = True     # re-apply throttle under the new gear
+        
+        if edges:
+            self.update_turn_from_buttons(edges)
+        
+        # Actuators are written as soon as input changes, not on a tick
+        if axes:
+            self.throttle = self.apply_controls(t_in)
+
     def run(self):
         print(f"Starting RC with {self.max_throttle*100:.0f}% throttle limit")
+        self.throttle = self.apply_gear_logic(self.raw_throttle)
+        loop = Periodic(CONTROL_PERIOD, wait=self.handle_input)
         try:
             while True:
-                steering, raw_t, gear = self.read_axes()
-                
-                # On gear change, tell the dashboard service
-                if gear and gear != self.current_gear:
-                    self.current_gear = gear
-                    self.piracer.set_throttle_percent(0.0)  # jerk guard
-                    try:
-                        self.dashboard.SetGear(gear, timeout=0.3)
-                    except Exception as e:
-                        print(f"SetGear failed: {e}")
-                
-                throttle = self.apply_gear_logic(raw_t)
-                edges = self.read_button_edges()
-                if edges:
-                    self.update_turn_from_buttons(edges)
-                
-                self.piracer.set_steering_percent(steering)
-                self.piracer.set_throttle_percent(throttle)
+                loop.tick()
                 
                 # print less frequently (every 0.3 s) with better formatting
                 if time.time() - self._last_print > 0.3:
-                    print(f"[{self.current_gear}] T:{throttle:+.2f} S:{steering:+.2f} | "
-                          f"Speed:{self.current_speed:5.1f} cm/s Batt:{self.current_batt:4.1f}% Turn:{self.turn_mode}")
+                    print(f"[{self.current_gear}] T:{self.throttle:+.2f} S:{self.steering:+.2f} | "
+                          f"Speed:{self.dash.speed:5.1f} cm/s Batt:{self.dash.battery:4.1f}% Turn:{self.turn_mode}")
                     self._last_print = time.time()
                 
-                time.sleep(0.05)
-                
         except KeyboardInterrupt:
             self.piracer.set_throttle_percent(0.0)
             self.piracer.set_steering_percent(0.0)
             self.set_turn_signal("off")
+            self.dash.calls.flush(SHUTDOWN_FLUSH)
+            print(self.dash.calls.summary())
+            print(f"Control loop: {loop.summary()}")
+            if self.lat_n:
+                print(f"Input->actuator: n={self.lat_n} avg={self.lat_sum / self.lat_n * 1000:.2f}ms "
+                      f"max={self.lat_max * 1000:.2f}ms")
 
 if __name__ == "__main__":
-    RCExample().run()
+    parser = argparse.ArgumentParser()
+    rt_sched.add_arguments(parser, what='control loop')
+    args = parser.parse_args()
+    rc = RCExample()
+    # After setup: the D-Bus thread is already running and keeps default scheduling
+    rt_sched.ThreadPolicy.from_args(args).apply('control loop')
+    rc.run()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+CPU pinning and real-time scheduling for worker threads (Linux):
+- ThreadPolicy: affinity, SCHED_FIFO/SCHED_RR priority or nice level,
+  applied from inside the thread it should affect
+- Every step falls back with a message when not permitted (no CAP_SYS_NICE,
+  offline CPU, non-Linux) instead of stopping the caller
+- add_arguments()/ThreadPolicy.from_args() give services the same CLI flags
+- Jitter benchmark: python3 rt_sched.py --compare [--load N]
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+from periodic import Periodic
+
+SCHED_POLICIES = {
+    'other': getattr(os, 'SCHED_OTHER', 0),
+    'fifo': getattr(os, 'SCHED_FIFO', 1),
+    'rr': getattr(os, 'SCHED_RR', 2),
+}
+DEFAULT_RT_PRIO = 50   # mid-range; kernel IRQ threads run at 50 as well
+
+def parse_cpus(text):
+    """'2', '2,3' or '1-3' -> {CPU numbers}; None/'' -> None."""
+    if not text:
+        return None
+    cpus = set()
+    for part in str(text).split(','):
+        lo, _, hi = part.strip().partition('-')
+        cpus.update(range(int(lo), int(hi or lo) + 1))
+    return cpus
+
+class ThreadPolicy:
+    """Scheduling wishes for one thread; apply() from that thread."""
+    def __init__(self, cpus=None, sched=None, prio=None, nice=None):
+        if sched is not None and sched not in SCHED_POLICIES:
+            raise ValueError(f"unknown scheduling policy {sched!r} (use {'/'.join(SCHED_POLICIES)})")
+        self.cpus = parse_cpus(cpus) if isinstance(cpus, str) else cpus
+        self.sched = sched
+        self.prio = prio
+        self.nice = nice
+
+    def __bool__(self):
+        return bool(self.cpus) or self.sched is not None or self.nice is not None
+
+    def __str__(self):
+        parts = []
+        if self.cpus:
+            parts.append(f"cpus={','.join(map(str, sorted(self.cpus)))}")
+        if self.sched:
+            parts.append(self.sched + (f"/{self.prio or DEFAULT_RT_PRIO}" if self.sched != 'other' else ''))
+        if self.nice is not None:
+            parts.append(f"nice={self.nice:+d}")
+        return ' '.join(parts) or 'default'
+
+    @classmethod
+    def from_args(cls, args, prefix=''):
+        p = prefix.replace('-', '_') + '_' if prefix else ''
+        return cls(cpus=getattr(args, p + 'cpus'), sched=getattr(args, p + 'sched'),
+                   prio=getattr(args, p + 'prio'), nice=getattr(args, p + 'nice'))
+
+    def apply(self, name='thread'):
+        """Apply to the calling thread; returns True if everything took effect."""
+        ok = True
+        if self.cpus:
+            try:
+                os.sched_setaffinity(0, self.cpus)   # 0 = calling thread on Linux
+            except (OSError, AttributeError, ValueError) as e:
+                print(f"✗ {name}: CPU affinity {sorted(self.cpus)} not applied: {e}")
+                ok = False
+        if self.sched in ('fifo', 'rr'):
+            prio = self.prio or DEFAULT_RT_PRIO
+            try:
+                os.sched_setscheduler(0, SCHED_POLICIES[self.sched], os.sched_param(prio))
+            except (OSError, AttributeError) as e:
+                print(f"✗ {name}: SCHED_{self.sched.upper()} {prio} not permitted ({e}); "
+                      f"needs CAP_SYS_NICE or RLIMIT_RTPRIO >= {prio} (systemd LimitRTPRIO=)")
+                ok = False
+        if self.nice is not None:
+            try:
+                # per-thread on Linux: PRIO_PROCESS with the thread id
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+            except (OSError, AttributeError) as e:
+                print(f"✗ {name}: nice {self.nice:+d} not applied: {e}")
+                ok = False
+        if self and ok:
+            print(f"✓ {name}: {self}")
+        return ok
+
+def add_arguments(parser, prefix='', what='worker thread'):
+    """--[prefix-]cpus/--[prefix-]sched/--[prefix-]prio/--[prefix-]nice."""
+    p = f'--{prefix}-' if prefix else '--'
+    parser.add_argument(p + 'cpus', default=None,
+                        help=f'Pin the {what} to these CPUs (e.g. 3 or 2-3)')
+    parser.add_argument(p + 'sched', choices=tuple(SCHED_POLICIES), default=None,
+                        help=f'Scheduling policy for the {what} (fifo/rr need CAP_SYS_NICE)')
+    parser.add_argument(p + 'prio', type=int, default=None,
+                        help=f'Real-time priority 1-99 for fifo/rr (default {DEFAULT_RT_PRIO})')
+    parser.add_argument(p + 'nice', type=int, default=None,
+                        help=f'Nice level for the {what} (-20..19; < 0 needs CAP_SYS_NICE)')
+
+# ==================== Jitter benchmark ====================
+def _busy():
+    while True:
+        pass
+
+def measure_jitter(policy, period, seconds):
+    """Run a Periodic loop under `policy` on a fresh thread; returns sorted lateness (s)."""
+    lates = []
+
+    def worker():
+        policy.apply('bench')
+        loop = Periodic(period)
+        end = time.monotonic() + seconds
+        loop.tick()
+        while time.monotonic() < end:
+            lates.append(loop.tick())
+
+    t = threading.Thread(target=worker, name='bench')
+    t.start()
+    t.join()
+    lates.sort()
+    return lates
+
+def report(label, lates):
+    if not lates:
+        print(f"{label:28s} no samples")
+        return
+    pick = lambda q: lates[min(len(lates) - 1, int(q * len(lates)))] * 1e6
+    print(f"{label:28s} n={len(lates):6d}  p50={pick(0.50):7.0f}us  p99={pick(0.99):7.0f}us  "
+          f"p99.9={pick(0.999):7.0f}us  max={lates[-1] * 1e6:7.0f}us")
+
+def main():
+    ap = argparse.ArgumentParser(description='Wake-up jitter of a fixed-rate loop per scheduling setting')
+    add_arguments(ap, what='benchmark loop')
+    ap.add_argument('--period', type=float, default=0.005, help='Loop period in s (default 5 ms)')
+    ap.add_argument('--seconds', type=float, default=10.0, help='Duration per setting')
+    ap.add_argument('--load', type=int, default=0,
+                    help='Busy-loop processes to start as competing load (e.g. one per core)')
+    ap.add_argument('--compare', action='store_true',
+                    help='Run default, nice -10, SCHED_FIFO and pinned SCHED_FIFO back to back')
+    args = ap.parse_args()
+
+    hogs = []
+    if args.load:
+        import multiprocessing
+        hogs = [multiprocessing.Process(target=_busy, daemon=True) for _ in range(args.load)]
+        for h in hogs:
+            h.start()
+    try:
+        if args.compare:
+            last_cpu = max(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else None
+            runs = [ThreadPolicy(), ThreadPolicy(nice=-10), ThreadPolicy(sched='fifo')]
+            if last_cpu is not None:
+                runs.append(ThreadPolicy(cpus={last_cpu}, sched='fifo'))
+        else:
+            runs = [ThreadPolicy.from_args(args)]
+        print(f"period={args.period * 1e3:.1f}ms  {args.seconds:.0f}s per run  load={args.load}")
+        for policy in runs:
+            report(str(policy), measure_jitter(policy, args.period, args.seconds))
+    finally:
+        for h in hogs:
+            h.terminate()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Recent-sample history for the dashboard service (speed, battery):
+- HistoryRing: fixed-size circular NumPy buffer of (monotonic ts, value)
+- decimate: min/max/mean per time bucket, so a graph of N points costs
+  one call regardless of how many samples the window holds
+- SampleHistory: one ring per field, sized from its nominal sample rate
+
+Imported lazily off the main thread (numpy is slow to import on the Pi).
+"""
+
+import math
+import threading
+import numpy as np
+
+# ==================== Tunables ====================
+HISTORY_SECONDS = 600.0   # default window kept per field
+MAX_POINTS = 2000         # hard cap on points returned per query
+
+# Nominal sample rates (Hz) used to size each ring
+FIELD_RATES = {
+    'speed': 20.0,     # filtered speed, every 0x100/0x101 frame
+    'battery': 1.0,    # published SOC %
+    'voltage': 7.0,    # raw INA219 samples at the fastest polling interval
+    'current': 7.0,
+    'power': 7.0,
+}
+
+# ==================== Ring buffer ====================
+class HistoryRing:
+    """
+    Circular (ts, value) buffer on two preallocated float64 arrays.
+    push() is O(1); window() copies out the requested span in time order.
+    One lock per ring: the writer is a single thread, readers are D-Bus calls.
+    """
+    def __init__(self, capacity):
+        self.capacity = max(int(capacity), 2)
+        self.t = np.zeros(self.capacity)
+        self.v = np.zeros(self.capacity)
+        self._i = 0
+        self._n = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._n
+
+    def push(self, ts, value):
+        with self._lock:
+            i = self._i
+            self.t[i] = ts
+            self.v[i] = value
+            self._i = i + 1 if i + 1 < self.capacity else 0
+            if self._n < self.capacity:
+                self._n += 1
+
+    def window(self, since=None):
+        """(t, v) copies with t >= since, oldest first."""
+        with self._lock:
+            n, i = self._n, self._i
+            if n < self.capacity:
+                t, v = self.t[:n].copy(), self.v[:n].copy()
+            else:
+                t = np.concatenate((self.t[i:], self.t[:i]))
+                v = np.concatenate((self.v[i:], self.v[:i]))
+        if since is not None:
+            k = np.searchsorted(t, since)
+            t, v = t[k:], v[k:]
+        return t, v
+
+    def clear(self):
+        with self._lock:
+            self._i = self._n = 0
+
+# ==================== Decimation ====================
+def decimate(t, v, max_points, start=None, end=None):
+    """
+    Bucket [start, end] into max_points equal time slices and return
+    (t_mean, v_min, v_max, v_mean) for the non-empty ones. Min/max keep
+    spikes visible that plain subsampling would drop. Windows that
+    already fit are returned as-is (min = max = mean = value).
+    """
+    n = len(t)
+    if n <= max_points:
+        return t, v, v, v
+    start = t[0] if start is None else start
+    end = t[-1] if end is None else end
+    width = (end - start) / max_points
+    if width <= 0.0:
+        width = 1.0
+    bucket = np.minimum(((t - start) / width).astype(np.int64), max_points - 1)
+    starts = np.flatnonzero(np.diff(bucket, prepend=-1))
+    counts = np.diff(np.append(starts, n))
+    return (np.add.reduceat(t, starts) / counts,
+            np.minimum.reduceat(v, starts),
+            np.maximum.reduceat(v, starts),
+            np.add.reduceat(v, starts) / counts)
+
+# ==================== Per-field history ====================
+class SampleHistory:
+    def __init__(self, seconds=HISTORY_SECONDS, rates=FIELD_RATES):
+        self.seconds = seconds
+        self.rings = {name: HistoryRing(math.ceil(seconds * hz))
+                      for name, hz in rates.items()}
+
+    def push(self, field, ts, value):
+        self.rings[field].push(ts, value)
+
+    def query(self, field, now, seconds, max_points):
+        """
+        Last `seconds` of `field` (<= 0: everything kept), decimated to at
+        most max_points. Times are returned relative to now (<= 0 s).
+        Raises KeyError for an unknown field.
+        """
+        ring = self.rings[field]
+        since = now - seconds if seconds > 0 else None
+        t, v = ring.window(since)
+        max_points = min(max_points, MAX_POINTS) if max_points > 0 else MAX_POINTS
+        t, vmin, vmax, vmean = decimate(t, v, max_points, start=since, end=now)
+        return t - now, vmin, vmax, vmean
+
+    def stats(self):
+        return {f'history.{name}.samples': float(len(ring))
+                for name, ring in self.rings.items()}
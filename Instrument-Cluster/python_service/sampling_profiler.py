@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+In-process sampling profiler, cheap enough to leave running on a drive:
+- A daemon thread walks sys._current_frames() at a fixed rate (periodic.py)
+  and counts each thread's stack, keyed by code objects (no string work
+  per sample)
+- stop() writes collapsed stacks ("thread;outer;...;inner count"), the
+  input format of flamegraph.pl / speedscope / inferno
+- Tracks its own cost per sample so the overhead can be checked in the field
+"""
+
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+from periodic import Periodic
+
+DEFAULT_RATE_HZ = 100.0
+MAX_RATE_HZ = 1000.0
+MAX_DEPTH = 64           # frames kept per stack, counted from the leaf (outermost are dropped beyond this)
+THREAD_REFRESH = 1.0     # s between thread-name table refreshes
+
+class SamplingProfiler:
+    def __init__(self, rate_hz=DEFAULT_RATE_HZ):
+        self.rate_hz = min(max(float(rate_hz), 1.0), MAX_RATE_HZ)
+        self.counts = Counter()    # (thread name, (code, ...)) -> samples
+        self.samples = 0
+        self.started = None
+        self.stopped = None
+        self._cost = 0.0           # s spent inside _sample_once
+        self._names = {}
+        self._names_ts = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self._stop.clear()
+        self.started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stopped = time.monotonic()
+
+    def _run(self):
+        # Event.wait as the wait hook: stop() interrupts the sleep at once
+        loop = Periodic(1.0 / self.rate_hz, wait=self._stop.wait)
+        me = threading.get_ident()
+        while not self._stop.is_set():
+            if loop.tick() is None:
+                break
+            t0 = time.perf_counter()
+            self._sample_once(me)
+            self._cost += time.perf_counter() - t0
+
+    def _thread_name(self, ident, now):
+        if now - self._names_ts > THREAD_REFRESH:
+            self._names = {t.ident: t.name for t in threading.enumerate()}
+            self._names_ts = now
+        return self._names.get(ident) or f'thread-{ident}'
+
+    def _sample_once(self, skip_ident):
+        now = time.monotonic()
+        counts = self.counts
+        for ident, frame in sys._current_frames().items():
+            if ident == skip_ident:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            counts[(self._thread_name(ident, now), tuple(stack))] += 1
+        self.samples += 1
+
+    # ---------- Output ----------
+    @staticmethod
+    def _frame_label(code):
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def collapsed(self):
+        """Lines of 'thread;outer;...;inner count', heaviest first."""
+        merged = Counter()
+        for (thread, stack), n in self.counts.items():
+            frames = ';'.join(self._frame_label(c) for c in reversed(stack))
+            merged[f"{thread};{frames}" if frames else thread] += n
+        return [f"{k} {n}" for k, n in merged.most_common()]
+
+    def write(self, path):
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            for line in self.collapsed():
+                f.write(line + '\n')
+        os.replace(tmp, path)
+        return path
+
+    def stats(self, prefix='profiler'):
+        end = self.stopped if not self.running and self.stopped else time.monotonic()
+        wall = end - self.started if self.started else 0.0
+        n = self.samples
+        return {
+            f'{prefix}.running': 1.0 if self.running else 0.0,
+            f'{prefix}.rate_hz': self.rate_hz,
+            f'{prefix}.samples': float(n),
+            f'{prefix}.sample_us_avg': self._cost / n * 1e6 if n else 0.0,
+            f'{prefix}.overhead_pct': self._cost / wall * 100.0 if wall > 0 else 0.0,
+        }
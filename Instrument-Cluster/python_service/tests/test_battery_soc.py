@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""Tests for battery_soc.py against a fake INA219 with adafruit_ina219's attribute names."""
+
+import os
+import sys
+import random
+import tempfile
+import unittest
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import battery_soc
+from battery_soc import BatterySampler, Ina219Reader, RollingStats, SocCurve, DEFAULT_CURVE
+
+
+def ls_slope(ys):
+    """Reference least-squares slope against the sample index."""
+    n = len(ys)
+    mx = (n - 1) / 2.0
+    my = statistics.fmean(ys)
+    return (sum((j - mx) * (y - my) for j, y in enumerate(ys))
+            / sum((j - mx) ** 2 for j in range(n)))
+
+
+class RollingStatsTest(unittest.TestCase):
+    def test_matches_statistics_over_sliding_window(self):
+        rng = random.Random(7)
+        cap = 7
+        rs = RollingStats(cap)
+        window = []
+        # 10 windows: crosses eviction and several _resync points
+        for _ in range(10 * cap):
+            y = 11.0 + rng.uniform(-0.5, 0.5)
+            rs.push(y)
+            window = (window + [y])[-cap:]
+            self.assertEqual(len(rs), len(window))
+            self.assertEqual(rs.values(), window)
+            self.assertAlmostEqual(rs.mean, statistics.fmean(window), places=12)
+            self.assertEqual(rs.min, min(window))
+            self.assertEqual(rs.max, max(window))
+            if len(window) >= 2:
+                self.assertAlmostEqual(rs.variance, statistics.variance(window), places=10)
+                self.assertAlmostEqual(rs.slope, ls_slope(window), places=10)
+
+    def test_min_max_expire_with_evicted_sample(self):
+        rs = RollingStats(3)
+        for y in (5.0, 1.0, 2.0, 3.0, 4.0):
+            rs.push(y)
+        self.assertEqual((rs.min, rs.max), (2.0, 4.0))
+
+    def test_slope_after_eviction(self):
+        rs = RollingStats(4)
+        for y in (100.0, -50.0, 1.0, 2.0, 3.0, 4.0):
+            rs.push(y)
+        self.assertAlmostEqual(rs.slope, 1.0)
+
+    def test_empty_and_single(self):
+        rs = RollingStats(4)
+        self.assertIsNone(rs.mean)
+        rs.push(3.0)
+        self.assertEqual(rs.mean, 3.0)
+        self.assertIsNone(rs.variance)
+        self.assertIsNone(rs.slope)
+
+    def test_clear(self):
+        rs = RollingStats(3)
+        for y in (1.0, 2.0, 3.0, 4.0):
+            rs.push(y)
+        rs.clear()
+        self.assertEqual(len(rs), 0)
+        self.assertIsNone(rs.min)
+
+
+class SocCurveTest(unittest.TestCase):
+    def setUp(self):
+        self.curve = SocCurve(DEFAULT_CURVE)
+
+    def test_rejects_non_monotonic(self):
+        with self.assertRaises(ValueError):
+            SocCurve([(10.0, 0), (11.0, 60), (12.0, 50)])
+        with self.assertRaises(ValueError):
+            SocCurve([(10.0, 0), (10.0, 50)])
+        with self.assertRaises(ValueError):
+            SocCurve([(10.0, 0)])
+
+    def test_lookup_interpolates_and_clamps(self):
+        self.assertEqual(self.curve.soc(12.60), 100)
+        self.assertEqual(self.curve.soc(11.22), 50)
+        self.assertAlmostEqual(self.curve.soc(11.16), 47.5)
+        self.assertEqual(self.curve.soc(13.0), 100)
+        self.assertEqual(self.curve.soc(8.0), 0)
+
+    def test_inverse_lookup_round_trip(self):
+        for soc in (1.5, 12.0, 47.5, 63.0, 99.0):
+            v, dv = self.curve.voltage(soc)
+            self.assertGreater(dv, 0.0)
+            self.assertAlmostEqual(self.curve.soc(v), soc)
+
+    def test_load_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write("# name: test pack\n12.0, 100\n\n10.0 0\n")
+        try:
+            curve = SocCurve.load(f.name)
+        finally:
+            os.unlink(f.name)
+        self.assertEqual(curve.name, 'test pack')
+        self.assertAlmostEqual(curve.soc(11.0), 50.0)
+
+
+class FakeI2CDevice:
+    """adafruit_bus_device.I2CDevice subset over a {register: uint16} dict."""
+    def __init__(self, regs):
+        self.regs = regs
+        self.transfers = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def write_then_readinto(self, out_buffer, in_buffer, *, out_start=0, out_end=None,
+                            in_start=0, in_end=None):
+        self.transfers += 1
+        value = self.regs[out_buffer[out_start]]
+        in_buffer[in_start] = value >> 8
+        in_buffer[in_start + 1] = value & 0xFF
+
+
+class FakeINA219:
+    """Same public/raw attribute names as adafruit_ina219.INA219 (3.3-3.5)."""
+    def __init__(self, bus_mv=12000, cnvr=True, ovf=False, raw_current=1000, raw_power=600):
+        self.regs = {}
+        self.set_bus(bus_mv, cnvr, ovf)
+        self.regs[0x03] = raw_power
+        self.regs[0x04] = raw_current
+        self.i2c_device = FakeI2CDevice(self.regs)
+        self._cal_value = 4096
+        self._current_lsb = 0.1
+        self._power_lsb = 0.002
+        self.cal_writes = 0
+
+    def set_bus(self, bus_mv, cnvr=True, ovf=False):
+        self.regs[0x02] = ((bus_mv // 4) << 3) | (0x02 if cnvr else 0) | (0x01 if ovf else 0)
+
+    # Register views as in the driver: the voltage field is already shifted
+    @property
+    def raw_bus_voltage(self):
+        return self.regs[0x02] >> 3
+
+    @property
+    def conversion_ready(self):
+        return bool(self.regs[0x02] & 0x02)
+
+    @property
+    def overflow(self):
+        return bool(self.regs[0x02] & 0x01)
+
+    @property
+    def raw_current(self):
+        return self.regs[0x04]
+
+    @property
+    def raw_power(self):
+        self.regs[0x02] &= ~0x02   # reading power clears CNVR
+        return self.regs[0x03]
+
+    @property
+    def _raw_calibration(self):
+        return self.regs.get(0x05, 0)
+
+    @_raw_calibration.setter
+    def _raw_calibration(self, value):
+        self.cal_writes += 1
+        self.regs[0x05] = value
+
+    @property
+    def bus_voltage(self):
+        return self.raw_bus_voltage * 0.004
+
+    @property
+    def current(self):
+        self._raw_calibration = self._cal_value
+        return self.raw_current * self._current_lsb
+
+    @property
+    def power(self):
+        self._raw_calibration = self._cal_value
+        return self.raw_power * self._power_lsb
+
+
+class Ina219ReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.ina = FakeINA219()
+        self.reader = Ina219Reader(self.ina)
+
+    def test_uses_raw_registers_of_real_driver(self):
+        self.assertTrue(self.reader._raw)
+
+    def test_decodes_full_bus_voltage_register(self):
+        voltage, current, power = self.reader.read()
+        self.assertAlmostEqual(voltage, 12.0)
+        self.assertAlmostEqual(voltage, self.ina.bus_voltage)
+        self.assertAlmostEqual(current, 100.0)
+        self.assertAlmostEqual(power, 1.2)
+
+    def test_stale_pass_reads_one_register(self):
+        self.reader.read()                     # power read cleared CNVR
+        tx = self.reader.transactions
+        self.assertIsNone(self.reader.read())
+        self.assertEqual(self.reader.stale, 1)
+        self.assertEqual(self.reader.transactions - tx, 1)
+
+    def test_overflow_counted(self):
+        self.ina.set_bus(12000, ovf=True)
+        self.assertIsNotNone(self.reader.read())
+        self.assertEqual(self.reader.overflows, 1)
+
+    def test_transactions_per_pass(self):
+        self.reader.read()                     # pass 0 also rewrites calibration
+        tx = self.reader.transactions
+        self.ina.set_bus(11500)
+        voltage, _, _ = self.reader.read()
+        self.assertAlmostEqual(voltage, 11.5)
+        self.assertEqual(self.reader.transactions - tx, 3)
+        self.assertEqual(self.ina.cal_writes, 1)
+
+    def test_calibration_refreshed_every_cal_refresh_passes(self):
+        for _ in range(battery_soc.CAL_REFRESH + 1):
+            self.ina.set_bus(12000)
+            self.reader.read()
+        self.assertEqual(self.ina.cal_writes, 2)
+
+    def test_property_fallback_without_raw_registers(self):
+        class Plain:
+            bus_voltage, current, power = 11.1, 250.0, 2.8
+        reader = Ina219Reader(Plain())
+        self.assertFalse(reader._raw)
+        self.assertEqual(reader.read(), (11.1, 250.0, 2.8))
+
+
+class FlatCurve:
+    """OCV curve with zero slope: the EKF correction is a no-op, only coulomb counting moves SOC."""
+    def soc(self, voltage):
+        return 50.0
+
+    def voltage(self, soc):
+        return 11.2, 0.0
+
+
+class CoulombCountingTest(unittest.TestCase):
+    def test_integrates_at_max_period(self):
+        sampler = BatterySampler(FakeINA219(), max_period=5.0)
+        ekf = sampler.ekf
+        ekf.curve = FlatCurve()
+        dt = sampler.max_period * 1.02         # parked pass woken slightly late
+        ekf.update(11.2, 260.0, 100.0)
+        ekf.update(11.2, 260.0, 100.0 + dt)
+        expected = 50.0 - 0.26 * dt * 1000.0 / 3600.0 / ekf.capacity_mah * 100.0
+        self.assertAlmostEqual(ekf.soc, expected)
+
+    def test_parked_to_load_step_is_trapezoidal(self):
+        sampler = BatterySampler(FakeINA219(), max_period=5.0)
+        ekf = sampler.ekf
+        ekf.curve = FlatCurve()
+        ekf.update(11.2, 100.0, 0.0)           # parked
+        ekf.update(11.2, 3000.0, 5.0)          # first sample under throttle
+        mean_amps = 0.5 * (0.1 + 3.0)
+        expected = 50.0 - mean_amps * 5.0 * 1000.0 / 3600.0 / ekf.capacity_mah * 100.0
+        self.assertAlmostEqual(ekf.soc, expected)
+
+    def test_max_dt_follows_max_period(self):
+        sampler = BatterySampler(FakeINA219(), max_period=20.0)
+        self.assertGreater(sampler.ekf.max_dt, 20.0 * 1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Tests for can_link_stats.py: gaps come from receive timestamps, not read times."""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from can_link_stats import CanLinkStats
+
+PERIOD = 0.05
+
+
+class CanLinkStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.stats = CanLinkStats(periods={0x100: PERIOD})
+
+    def counters(self):
+        snap = self.stats.snapshot()
+        return snap['can.0x100.late'], snap['can.0x100.missed'], snap['can.0x100.stalls']
+
+    def test_backlog_burst_not_counted_as_missed(self):
+        # Reader stalled for 0.3 s: six frames queued in the socket, each with
+        # its kernel receive time, then read back to back
+        for k in range(20):
+            self.stats.on_frame(0x100, 100.0 + k * PERIOD)
+        self.assertEqual(self.counters(), (0.0, 0.0, 0.0))
+        self.assertAlmostEqual(self.stats.snapshot()['can.0x100.max_gap_ms'], PERIOD * 1e3)
+
+    def test_missing_frames_counted(self):
+        for ts in (0.0, 0.05, 0.2, 0.25):       # 0.10 and 0.15 never arrived
+            self.stats.on_frame(0x100, ts)
+        self.assertEqual(self.counters(), (1.0, 2.0, 0.0))
+
+    def test_stall(self):
+        self.stats.on_frame(0x100, 0.0)
+        self.stats.on_frame(0x100, 2.0)
+        self.assertEqual(self.counters(), (0.0, 0.0, 1.0))
+
+    def test_unmonitored_id_only_counted(self):
+        self.stats.on_frame(0x102, 0.0)
+        self.stats.on_frame(0x102, 5.0)
+        snap = self.stats.snapshot()
+        self.assertEqual(snap['can.frames'], 2.0)
+        self.assertEqual(snap['can.0x102.stalls'], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Tests for periodic.py with a fake clock: deadlines, skip/catchup realignment, wait hook."""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from periodic import Periodic, SKIP, CATCHUP
+
+
+class FakeClock:
+    """clock() and wait(timeout) over simulated time; wait oversleeps by `late`."""
+    def __init__(self, late=0.0):
+        self.t = 0.0
+        self.late = late
+        self.waits = []
+
+    def __call__(self):
+        return self.t
+
+    def wait(self, timeout):
+        self.waits.append(timeout)
+        self.t += timeout + self.late
+
+
+def make(period=0.1, policy=SKIP, late=0.0, **kw):
+    clock = FakeClock(late)
+    return Periodic(period, policy=policy, wait=clock.wait, clock=clock, **kw), clock
+
+
+class PeriodicTest(unittest.TestCase):
+    def test_absolute_deadlines_do_not_drift(self):
+        loop, clock = make(0.1, late=0.002)
+        loop.tick()
+        for k in range(1, 51):
+            clock.t += 0.03                    # body time
+            late = loop.tick()
+            self.assertAlmostEqual(late, 0.002)
+            self.assertAlmostEqual(clock.t, k * 0.1 + 0.002)
+        self.assertEqual(loop.overruns, 0)
+        self.assertAlmostEqual(loop.late_max, 0.002)
+
+    def test_skip_realigns_to_grid(self):
+        loop, clock = make(0.1, SKIP)
+        loop.tick()
+        clock.t = 0.35                         # body overran by 2.5 periods
+        late = loop.tick()
+        self.assertEqual(loop.overruns, 1)
+        self.assertEqual(loop.skipped, 2)
+        self.assertAlmostEqual(late, 0.05)     # latest grid slot 0.3 <= now
+        clock.t += 0.01
+        loop.tick()
+        self.assertAlmostEqual(clock.t, 0.4)   # back on the grid
+
+    def test_catchup_runs_missed_ticks_back_to_back(self):
+        loop, clock = make(0.1, CATCHUP)
+        loop.tick()
+        clock.t = 0.35
+        lates = [loop.tick() for _ in range(3)]
+        self.assertEqual(loop.skipped, 0)
+        self.assertEqual([round(x, 6) for x in lates], [0.25, 0.15, 0.05])
+        self.assertEqual(clock.waits, [])      # no sleeping while behind
+        loop.tick()
+        self.assertAlmostEqual(clock.t, 0.4)
+
+    def test_catchup_bounded_by_max_catchup(self):
+        loop, clock = make(0.1, CATCHUP, max_catchup=2)
+        loop.tick()
+        clock.t = 1.05
+        loop.tick()
+        self.assertEqual(loop.skipped, 9)
+        clock.t += 0.01
+        loop.tick()
+        self.assertAlmostEqual(clock.t, 1.1)
+
+    def test_period_change_applies_from_previous_deadline(self):
+        loop, clock = make(0.1)
+        loop.tick()
+        loop.tick()
+        loop.period = 0.5
+        loop.tick()
+        self.assertAlmostEqual(clock.t, 0.6)
+
+    def test_wait_returning_true_interrupts(self):
+        clock = FakeClock()
+        loop = Periodic(0.1, wait=lambda timeout: True, clock=clock)
+        loop.tick()
+        self.assertIsNone(loop.tick())
+        self.assertEqual(loop.ticks, 1)
+
+    def test_early_wake_keeps_waiting(self):
+        clock = FakeClock()
+
+        def wait(timeout):                     # e.g. an input event woke us early
+            clock.t += min(timeout, 0.03)
+
+        loop = Periodic(0.1, wait=wait, clock=clock)
+        loop.tick()
+        loop.tick()
+        self.assertAlmostEqual(clock.t, 0.1)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            Periodic(0.1, policy='drop')
+
+
+if __name__ == '__main__':
+    unittest.main()
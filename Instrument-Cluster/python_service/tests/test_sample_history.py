@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Tests for sample_history.py: ring wrap-around and min/max/mean bucketing."""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import numpy as np
+    from sample_history import HistoryRing, SampleHistory, decimate
+except ImportError:      # numpy is optional on the Pi
+    np = None
+
+
+@unittest.skipIf(np is None, 'numpy not installed')
+class HistoryRingTest(unittest.TestCase):
+    def test_window_in_time_order_after_wrap(self):
+        ring = HistoryRing(4)
+        for k in range(7):
+            ring.push(float(k), 10.0 * k)
+        t, v = ring.window()
+        self.assertEqual(t.tolist(), [3.0, 4.0, 5.0, 6.0])
+        self.assertEqual(v.tolist(), [30.0, 40.0, 50.0, 60.0])
+        t, _ = ring.window(since=4.5)
+        self.assertEqual(t.tolist(), [5.0, 6.0])
+
+
+@unittest.skipIf(np is None, 'numpy not installed')
+class DecimateTest(unittest.TestCase):
+    def test_small_window_returned_as_is(self):
+        t = np.arange(5.0)
+        v = t * 2
+        out = decimate(t, v, 10)
+        for arr in out[1:]:
+            self.assertEqual(arr.tolist(), v.tolist())
+
+    def test_buckets_against_reference(self):
+        rng = np.random.default_rng(3)
+        t = np.sort(rng.uniform(0.0, 10.0, 1000))
+        v = rng.normal(size=1000)
+        v[500] = 50.0                           # a spike must survive
+        tm, vmin, vmax, vmean = decimate(t, v, 20, start=0.0, end=10.0)
+        bucket = np.minimum((t / 0.5).astype(int), 19)
+        ref = [b for b in range(20) if (bucket == b).any()]
+        self.assertEqual(len(tm), len(ref))
+        for i, b in enumerate(ref):
+            sel = bucket == b
+            self.assertAlmostEqual(tm[i], t[sel].mean())
+            self.assertAlmostEqual(vmin[i], v[sel].min())
+            self.assertAlmostEqual(vmax[i], v[sel].max())
+            self.assertAlmostEqual(vmean[i], v[sel].mean())
+        self.assertEqual(vmax.max(), 50.0)
+
+    def test_empty_buckets_skipped(self):
+        t = np.array([0.0, 0.1, 0.2, 9.8, 9.9, 10.0])
+        v = np.arange(6.0)
+        tm, vmin, vmax, _ = decimate(t, v, 4, start=0.0, end=10.0)
+        self.assertEqual(vmin.tolist(), [0.0, 3.0])
+        self.assertEqual(vmax.tolist(), [2.0, 5.0])
+
+
+@unittest.skipIf(np is None, 'numpy not installed')
+class SampleHistoryTest(unittest.TestCase):
+    def test_query_relative_times_and_cap(self):
+        hist = SampleHistory(seconds=100.0, rates={'speed': 10.0})
+        for k in range(1000):
+            hist.push('speed', k * 0.1, float(k))
+        t, vmin, vmax, _ = hist.query('speed', 100.0, 10.0, 50)
+        self.assertLessEqual(len(t), 50)
+        self.assertTrue((t <= 0.0).all() and (t >= -10.0).all())
+        self.assertEqual(vmax.max(), 999.0)
+        with self.assertRaises(KeyError):
+            hist.query('rpm', 100.0, 10.0, 50)
+
+
+if __name__ == '__main__':
+    unittest.main()